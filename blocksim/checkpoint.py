@@ -0,0 +1,228 @@
+import inspect
+import json
+import pickle
+from functools import lru_cache
+from pathlib import Path
+from simpy.events import Condition, Event, Process, Timeout
+from blocksim.models.inbox import Inbox
+from blocksim.models.network import Connection
+from blocksim.models.node import Node
+from blocksim.models.permissioned_network import PermissionedNetwork
+from blocksim.snapshot import (
+    META_FILE, read_meta, open_snapshot_dir, commit_snapshot_dir, write_transactions, read_transactions)
+from blocksim.utils import get_random_state, set_random_state
+
+STATE_FILE = 'checkpoint.pickle'
+
+
+def checkpoint_path(chains_dir, day: int):
+    """Directory of the checkpoint of a `day` in progress in `chains_dir`"""
+    return Path(chains_dir) / f'day_{day}_checkpoint'
+
+
+class _WorldPickler(pickle.Pickler):
+    """Pickles the environment, the network, the nodes and their connections as references,
+    bound to the ones of the world that restores the checkpoint, and the SimPy events as
+    their trigger state"""
+
+    def __init__(self, file, env, network):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.env = env
+        self.network = network
+
+    def persistent_id(self, obj):
+        if obj is self.env:
+            return ('env',)
+        if obj is self.network:
+            return ('network',)
+        if isinstance(obj, Node):
+            return ('node', obj.address)
+        if isinstance(obj, Connection):
+            return ('connection', obj.origin_node.address, obj.destination_node.address)
+        if isinstance(obj, Event):
+            return ('event', obj.triggered)
+        return None
+
+
+class _WorldUnpickler(pickle.Unpickler):
+    def __init__(self, file, env, network, nodes):
+        super().__init__(file)
+        self.env = env
+        self.network = network
+        self.nodes = {node.address: node for node in nodes}
+
+    def persistent_load(self, pid):
+        kind = pid[0]
+        if kind == 'env':
+            return self.env
+        if kind == 'network':
+            return self.network
+        if kind == 'node':
+            return self.nodes[pid[1]]
+        if kind == 'connection':
+            return self.nodes[pid[1]].active_sessions[pid[2]]['connection']
+        if kind == 'event':
+            event = self.env.event()
+            if pid[1]:
+                event.succeed()
+            return event
+        raise pickle.UnpicklingError(f'Unknown reference {pid}')
+
+
+def _waiting_processes(event):
+    """Yields the processes waiting for `event`, directly or through a condition,
+    and `None` for any other callback"""
+    for callback in event.callbacks or ():
+        owner = getattr(callback, '__self__', None)
+        if owner is event:
+            continue
+        if isinstance(owner, Process):
+            yield owner
+        elif isinstance(owner, Condition):
+            yield from _waiting_processes(owner)
+        else:
+            yield None
+
+
+@lru_cache(maxsize=None)
+def _is_resumable(cls, method_name):
+    method = getattr(cls, method_name, None)
+    return method is not None and 'resume_at' in inspect.signature(method).parameters
+
+
+def _pending_processes(env):
+    """Returns the processes to restart when resuming from now, as `(owner, method, at)`
+    tuples ordered as they are scheduled, or `None` if now is not a safe point.
+
+    Now is a safe point if every process waiting for a scheduled event is either:
+
+    - a resumable process waiting for a timeout: a generator method with a `resume_at`
+      argument, which is called again with the time of the timeout
+    - the delivery process of an `Inbox`, restarted with the envelopes of the inbox
+    - a process waiting for the end of a `multicast`, which has nothing left to do
+    """
+    resumable = []
+    for at, _, eid, event in env._queue:
+        for process in _waiting_processes(event):
+            if process is None:
+                return None
+            generator = process._generator
+            owner = generator.gi_frame.f_locals.get('self')
+            if isinstance(owner, Inbox):
+                continue
+            inner = generator
+            while inner.gi_yieldfrom is not None:
+                inner = inner.gi_yieldfrom
+            if inner.gi_code is PermissionedNetwork.multicast.__code__:
+                continue
+            if not (process._target is event and isinstance(event, Timeout)
+                    and _is_resumable(type(owner), generator.__name__)):
+                return None
+            resumable.append((eid, owner, generator.__name__, at))
+    resumable.sort(key=lambda process: process[0])
+    return [(owner, method, at) for _, owner, method, at in resumable]
+
+
+def save_checkpoint(world, network, nodes, path, at=None, **meta):
+    """Runs the `world` to the first safe point at or after the simulated time `at` (now by
+    default) and writes a checkpoint of it in the directory `path`, from which the simulation
+    can be resumed in another process with `Checkpoint`. The simulation is not stopped.
+
+    A checkpoint has the state of the network, of the nodes (chains, queues, inboxes, PBFT
+    logs and known inventories), the results monitored so far (`env.data`, propagation
+    metrics, transaction lifecycles and report buffers), the random streams and the pending
+    processes. SimPy processes can not be saved, so the checkpoint is taken at a safe point
+    (see `_pending_processes`), when every pending process can be restarted where it was.
+    Processes waiting for an event that is not scheduled (e.g. a handshake) are not saved.
+    The envelopes must be delivered by inboxes (`delivery` in the config).
+
+    Returns the simulated time of the checkpoint, or `None` if the simulation ended before
+    a safe point (no checkpoint is written).
+    """
+    env = world.env
+    if any(node.inbox is None for node in nodes):
+        raise ValueError('Checkpoints need the inbox delivery of envelopes ("delivery": "inbox" in the config)')
+    if at is not None:
+        world.run(until=at)
+    processes = _pending_processes(env)
+    while processes is None:
+        if env.peek() >= world.end:
+            return None
+        env.step()
+        processes = _pending_processes(env)
+
+    state = {
+        'data': env.data,
+        'blocks': env.blocks,
+        'propagation': env.propagation,
+        'tx_lifecycle': env.tx_lifecycle,
+        'report': env.report,
+        'network': network.__dict__,
+        'nodes': {node.address: node.__dict__ for node in nodes},
+        'processes': processes,
+        'random': get_random_state()
+    }
+    tmp = open_snapshot_dir(path)
+    with open(tmp / STATE_FILE, 'wb') as f:
+        _WorldPickler(f, env, network).dump(state)
+    write_transactions(tmp, env.transactions)
+    with open(tmp / META_FILE, 'w') as f:
+        json.dump(dict(meta, start=world.start, end=world.end, now=env.now), f, indent=2)
+    commit_snapshot_dir(tmp, path)
+    return env.now
+
+
+class Checkpoint:
+    """A checkpoint written by `save_checkpoint` in the directory `path`"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.meta = read_meta(self.path)
+        if self.meta is None:
+            raise FileNotFoundError(f'No checkpoint in {self.path}')
+
+    @property
+    def start(self):
+        return self.meta['start']
+
+    @property
+    def now(self):
+        return self.meta['now']
+
+    def restore(self, world, network, nodes):
+        """Resumes the checkpoint in a new `world` with the same `start`, whose `network` and
+        `nodes` are built and connected like the ones of the checkpoint, but without any
+        transaction nor heartbeat started: their processes scheduled so far are dropped and
+        the clock is moved to the time of the checkpoint.
+
+        The world can have another config, to branch what-if variants from a common prefix:
+        the config is read from `env.config` as the simulation goes, and the node attributes
+        set from the config when the nodes are built (their `CONFIG_ATTRIBUTES`) keep the
+        values of the new config."""
+        env = world.env
+        env._queue.clear()
+        env._now = self.now
+        with open(self.path / STATE_FILE, 'rb') as f:
+            state = _WorldUnpickler(f, env, network, nodes).load()
+
+        env.transactions = read_transactions(self.path)
+        env.data = state['data']
+        env.blocks = state['blocks']
+        env.propagation = state['propagation']
+        env.tx_lifecycle = state['tx_lifecycle']
+        env.report = state['report']
+        network.__dict__.update(state['network'])
+        for node in nodes:
+            configured = {
+                name: node.__dict__[name] for name in getattr(node, 'CONFIG_ATTRIBUTES', ())
+                if name in node.__dict__}
+            node.__dict__.update(state['nodes'][node.address])
+            node.__dict__.update(configured)
+        # Counts kept by the network from the config of its nodes, e.g. the honest authorities
+        if hasattr(network, 'count_honest_authorities'):
+            network.count_honest_authorities()
+        for owner, method, at in state['processes']:
+            env.process(getattr(owner, method)(resume_at=at))
+        for node in nodes:
+            node.inbox.resume()
+        set_random_state(state['random'])
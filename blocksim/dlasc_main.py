@@ -1,32 +1,32 @@
 import time
-import json
 from blocksim.world import SimulationWorld
 from blocksim.dlasc_node_factory import NodeFactory
 from blocksim.dlasc_transaction_factory import TransactionFactory
 from blocksim.models.network import Network
 
 
+REPORT_PATH = 'output/report.json'
+
+
 def write_report(world):
-    with open('output/report.json', 'w') as f:
-        # f.write(dump_json(world.env.data))
-        json.dump(world.env.data, f, indent=2)
+    world.env.report.close(world.env.data, REPORT_PATH)
 
 
 def report_node_chain(world, nodes_list):
     for node in nodes_list:
         head = node.chain.head
-        chain_list = []
-        num_blocks = 0
-        for i in range(head.header.number):
-            b = node.chain.get_block_by_number(i)
-            chain_list.append(str(b.header))
-            num_blocks += 1
-        chain_list.append(str(head.header))
+        num_blocks = head.header.number
+        # The blocks of the chain are a table of the report
+        if world.env.report.wants('chains'):
+            headers = [str(node.chain.get_block_by_number(i).header) for i in range(num_blocks)]
+            headers.append(str(head.header))
+            world.env.report.rows(
+                'chains', node=[node.address] * len(headers),
+                number=list(range(len(headers))), header=headers)
         key = f'{node.address}_chain'
         world.env.data[key] = {
             'head_block_hash': f'{head.header.hash[:8]} #{head.header.number}',
-            'number_of_blocks': num_blocks,
-            'chain_list': chain_list
+            'number_of_blocks': num_blocks
         }
 
 
@@ -79,6 +79,8 @@ def run_model():
     transaction_factory = TransactionFactory(world)
     transaction_factory.broadcast(10, 1, 1500, nodes_list)
 
+    # Stream the report tables during the run
+    world.env.report.open(REPORT_PATH)
     world.start_simulation()
     report_node_chain(world, nodes_list)
     write_report(world)
@@ -2,7 +2,7 @@ from blocksim.models.node import Node
 from blocksim.models.network import Network
 from blocksim.models.bitcoin.message import Message
 from blocksim.models.chain import Chain
-from blocksim.models.db import BaseDB
+from blocksim.models.chain_index import ChainIndex
 from blocksim.models.consensus import Consensus
 from blocksim.models.transaction_queue import TransactionQueue
 from blocksim.models.block import Block, BlockHeader
@@ -22,7 +22,7 @@ class BTCNode(Node):
         self.verbose = verbose
         genesis = Block(BlockHeader())
         consensus = Consensus(env)
-        chain = Chain(env, self, consensus, genesis, BaseDB())
+        chain = Chain(env, self, consensus, genesis, ChainIndex(env.blocks))
         self.hashrate = hashrate
         self.is_mining = is_mining
         super().__init__(env,
@@ -165,19 +165,16 @@ class BTCNode(Node):
         """Broadcast transactions to all nodes with an active session and mark the hashes
         as known by each node"""
         yield self.connecting  # Wait for all connections
-        for node_address, node in self.active_sessions.items():
-            transactions_hashes = []
-            for tx in transactions:
-                # Add the transaction to a temporary list
-                self.temp_txs[tx.hash] = tx
-                # Checks if the transaction was previous sent
-                if any({tx.hash} & node.get('knownTxs')):
-                    if self.verbose:
-                        print(
-                            f'{self.address} at {time(self.env)}: Transaction {tx.hash[:8]} was already sent to {node_address}')
-                else:
-                    self._mark_transaction(tx.hash, node_address)
-                    transactions_hashes.append(tx.hash)
+        for tx in transactions:
+            # Add the transaction to a temporary list
+            self.temp_txs[tx.hash] = tx
+        # Checks if the transactions were previously sent
+        hashes = [tx.hash for tx in transactions]
+        unknown = self._unknown_transactions(hashes)
+        if self.verbose and not unknown.all():
+            print(
+                f'{self.address} at {time(self.env)}: {len(hashes) - unknown.sum()} transactions were already sent')
+        transactions_hashes = [tx_hash for tx_hash, is_unknown in zip(hashes, unknown) if is_unknown]
         # Only send if it has transactions hashes
         if transactions_hashes:
             if self.verbose:
@@ -14,8 +14,12 @@ class BlockHeader:
     :param str coinbase: coinbase address of the block miner, in this simulation we include the node address
     :param int difficulty: the blocks difficulty
     :param str nonce: a nonce constituting a Proof-of-Work
+
+    Block headers are immutable, so the hash is computed once on first access and cached.
     """
 
+    __slots__ = ('prevhash', 'number', 'timestamp', 'coinbase', 'difficulty', 'nonce', '_hash')
+
     def __init__(self,
                  prevhash=encode_hex(b'\x00' * 32),
                  number=0,
@@ -30,10 +34,20 @@ class BlockHeader:
         self.difficulty = difficulty
         self.nonce = nonce
 
+    def __setattr__(self, name, value):
+        if hasattr(self, name):
+            raise AttributeError(f'{self.__class__.__name__} is immutable, {name} can not be changed')
+        super().__setattr__(name, value)
+
     @property
     def hash(self):
         """The block header hash"""
-        return encode_hex(keccak_256(str(self).encode('utf-8')))
+        try:
+            return self._hash
+        except AttributeError:
+            header_hash = encode_hex(keccak_256(str(self).encode('utf-8')))
+            object.__setattr__(self, '_hash', header_hash)
+            return header_hash
 
     def __repr__(self):
         """Returns a unambiguous representation of the block header"""
@@ -53,7 +67,7 @@ class BlockHeader:
         return not self.__eq__(other)
 
     def __hash__(self):
-        return self.hash
+        return hash(self.hash)
 
 
 class Block:
@@ -63,6 +77,8 @@ class Block:
     :param transactions: a list of transactions
     """
 
+    __slots__ = ('header', 'transactions')
+
     def __init__(self, header: BlockHeader, transactions=None):
         self.header = header
         self.transactions = transactions
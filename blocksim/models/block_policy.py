@@ -0,0 +1,104 @@
+from blocksim.utils import get_random_values, get_sampler
+
+
+class DistributionPolicy:
+    """Draws the number of transactions per block from the `number_transactions_per_block`
+    distribution, times `block_size_limit_mb` (the original behaviour)"""
+
+    def __init__(self, config: dict, params: dict):
+        self.distribution = config['number_transactions_per_block']
+        self.block_size = config['block_size_limit_mb']
+
+    def block_size_for(self, node):
+        return int(get_random_values(self.distribution)[0]) * self.block_size
+
+
+class FixedPolicy:
+    """Always the same number of `transactions` per block"""
+
+    def __init__(self, config: dict, params: dict):
+        self.transactions = int(params['transactions'])
+
+    def block_size_for(self, node):
+        return self.transactions
+
+
+class QueuePolicy:
+    """Takes all the transactions waiting in the queue of the node, up to `max_transactions`
+    (no limit by default), so the blocks grow with the backlog during bursts"""
+
+    def __init__(self, config: dict, params: dict):
+        self.max_transactions = params.get('max_transactions')
+
+    def block_size_for(self, node):
+        queued = node.transaction_queue.size()
+        if self.max_transactions is None:
+            return queued
+        return min(queued, self.max_transactions)
+
+
+class LatencyTargetPolicy:
+    """Adapts the size of the blocks to keep the commit latency under `target_seconds`, with
+    an additive increase / multiplicative decrease: the size grows by `step` transactions
+    while the commit latencies are under the target, and is halved as soon as one is over.
+    The size stays between `min_transactions` and `max_transactions`, and a block never has
+    more transactions than the queue.
+
+    The size starts from `initial_transactions`, by default the mean size of the
+    `distribution` policy, and `step` is a tenth of it by default. The commit latencies are
+    the ones of the pBFT network (`commit_latencies`), and the policy is shared by its
+    authorities (see `network_block_policy`), so each primary builds on the size left by
+    the previous one."""
+
+    def __init__(self, config: dict, params: dict):
+        self.target = params['target_seconds']
+        self.min_transactions = params.get('min_transactions', 1)
+        self.max_transactions = params['max_transactions']
+        mean_size = int(get_sampler(config['number_transactions_per_block']).frozen.mean() *
+                        config['block_size_limit_mb'])
+        initial = params.get('initial_transactions', mean_size)
+        self.size = min(self.max_transactions, max(self.min_transactions, initial))
+        self.step = params.get('step', max(1, self.size // 10))
+        # Number of commit latencies already taken into account
+        self._seen = 0
+
+    def block_size_for(self, node):
+        latencies = getattr(node.network, 'commit_latencies', None)
+        if latencies is None:
+            raise ValueError('The latency block policy needs the commit latencies of a pBFT network')
+        new_latencies = latencies[self._seen:]
+        self._seen = len(latencies)
+        if new_latencies:
+            if max(new_latencies) > self.target:
+                self.size = max(self.min_transactions, self.size // 2)
+            else:
+                self.size = min(self.max_transactions, self.size + self.step)
+        return min(self.size, node.transaction_queue.size())
+
+
+BLOCK_POLICIES = {
+    'distribution': DistributionPolicy,
+    'fixed': FixedPolicy,
+    'queue': QueuePolicy,
+    'latency': LatencyTargetPolicy
+}
+
+
+def block_policy(config: dict):
+    """Returns the block assembly policy of a consensus `config` (e.g. `config['pbft']`), set by
+    its optional `block_policy` entry: `{'name': ..., <parameters of the policy>}`. The policy
+    tells how many transactions of its queue a node puts in its next block (`block_size_for`)."""
+    params = config.get('block_policy', {'name': 'distribution'})
+    name = params['name']
+    if name not in BLOCK_POLICIES:
+        raise KeyError(f'Unknown block policy {name}, expected one of {list(BLOCK_POLICIES)}')
+    return BLOCK_POLICIES[name](config, params)
+
+
+def network_block_policy(network, config: dict):
+    """Returns the block policy of a consensus `config` shared by the authorities of a
+    `network`, created by the first of them, so a policy with a state (e.g. `latency`) has
+    one for the whole network"""
+    if network.block_policy is None:
+        network.block_policy = block_policy(config)
+    return network.block_policy
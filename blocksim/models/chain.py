@@ -1,5 +1,4 @@
 import random
-import itertools
 from blocksim.utils import time
 
 
@@ -11,24 +10,23 @@ class Chain:
         self.env = env
         self.node = node
         self.consensus = consensus
+        # The `ChainIndex` of the blocks known by the node, in the store shared by all nodes
         self.db = db
         self.genesis = genesis
         self.verbose = self.env.config["verbose"]
 
         # Set the score (AKA total difficulty in PoW)
-        self.db.put(f'score:{genesis.header.hash}', "0")
+        self.db.scores[genesis.header.hash] = 0
 
         # Init the chain with the Genesis block
-        self.db.put(f'block:{genesis.header.number}', genesis.header.hash)
-        self.db.put(genesis.header.hash, genesis)
+        self.db.set_head(genesis)
         self._head_hash = genesis.header.hash
         self.parent_queue = {}
 
     @property
     def head(self):
         """Block in the head (tip) of the chain"""
-        block = self.db.get(self._head_hash)
-        return block
+        return self.db.get_block(self._head_hash)
 
     def get_parent(self, block):
         """Genesis Block do not have parent"""
@@ -38,17 +36,11 @@ class Chain:
 
     def get_block(self, block_hash):
         """Gets the block with a given block hash"""
-        try:
-            return self.db.get(block_hash)
-        except BaseException:
-            return None
+        return self.db.get_block(block_hash)
 
     def get_blockhash_by_number(self, number):
         """Gets the hash of the block with the given block number"""
-        try:
-            return self.db.get(f'block:{number}')
-        except BaseException:
-            return None
+        return self.db.canonical_hash(number)
 
     def get_block_by_number(self, number):
         """Gets the block with the given block number"""
@@ -57,46 +49,28 @@ class Chain:
     def add_child(self, child):
         """Add a record allowing you to later look up the provided block's
         parent hash and see that it is one of its children"""
-        try:
-            existing = self.db.get('child:' + child.header.prevhash)
-        except BaseException:
-            existing = ''
-        existing_hashes = []
-        for i in range(0, len(existing), 32):
-            existing_hashes.append(existing[i: i + 32])
-        if child.header.hash not in existing_hashes:
-            self.db.put(
-                'child:' + child.header.prevhash,
-                existing + child.header.hash)
+        # Children are recorded by the shared block store when the child is stored
+        self.db.store.add(child)
 
     def get_child_hashes(self, block_hash):
         """Get the hashes of all known children of a given block"""
-        child_hashes = []
-        try:
-            data = self.db.get('child:' + block_hash)
-            for i in range(0, len(data), 32):
-                child_hashes.append(data[i:i + 32])
-            return child_hashes
-        except BaseException:
-            return []
+        return [h for h in self.db.store.children.get(block_hash, ()) if h in self.db]
 
     def get_pow_difficulty(self, block):
         """Get the total difficulty in PoW of a given block"""
         if not block:
             return 0
-        key = f'score:{block.header.hash}'
+        scores = self.db.scores
         fills = []
-        while key not in self.db:
-            fills.insert(0, (block.header.hash, block.header.difficulty))
-            key = f'score:{block.header.prevhash}'
+        while block.header.hash not in scores:
+            fills.insert(0, block)
             block = self.get_parent(block)
             if block is None:
                 return 0
-        score = int(self.db.get(key))
-        for h, d in fills:
-            key = f'score:{h}'
-            score = score + d + random.randrange(10**6 + 1)
-            self.db.put(key, str(score))
+        score = scores[block.header.hash]
+        for b in fills:
+            score = score + b.header.difficulty + random.randrange(10**6 + 1)
+            scores[b.header.hash] = score
         return score
 
     def get_children(self, block):
@@ -110,7 +84,7 @@ class Chain:
             if self.verbose:
                 print(
                     f'{self.node.address} at {time(self.env)}: Adding block #{block.header.number} ({block.header.hash[:8]}) to the head', )
-            self.db.put(f'block:{block.header.number}', block.header.hash)
+            self.db.set_head(block)
             self._head_hash = block.header.hash
         # Or is the block being added to a chain repeatedly?
         elif block.header.hash in self.db:
@@ -125,50 +99,15 @@ class Chain:
             block_td = self.get_pow_difficulty(block)
             # If the block should be the new head, replace the head
             if block_td > self.get_pow_difficulty(self.head):
-                b = block
-                new_chain = {}
-                # Find common ancestor
-                while b.header.number >= 0:
-                    new_chain[b.header.number] = b
-                    key = f'block:{b.header.number}'
-                    orig_at_height = self.db.get(
-                        key) if key in self.db else None
-                    if orig_at_height == b.header.hash:
-                        break
-                    if b.header.prevhash not in self.db or self.db.get(
-                            b.header.prevhash) == self.genesis.header.hash:
-                        break
-                    b = self.get_parent(b)
-                replace_from = b.header.number
-                # Replace block index and transactions
-
-                # Read: for i in range(common ancestor block number...new block
-                # number)
-                for i in itertools.count(replace_from):
-                    if self.verbose:
+                # Replace the main chain from the common ancestor to the new block
+                removed, added = self.db.set_head(block)
+                if self.verbose:
+                    for old_hash in removed:
+                        print(
+                            f'{self.node.address} at {time(self.env)}: {old_hash} no longer in main chain')
+                    for new_hash in added:
                         print(
-                            f'{self.node.address} at {time(self.env)}: Rewriting height {i}')
-                    key = f'block:{i}'
-                    # Delete data for old blocks
-                    orig_at_height = self.db.get(
-                        key) if key in self.db else None
-                    if orig_at_height:
-                        orig_block_at_height = self.get_block(orig_at_height)
-                        if self.verbose:
-                            print(
-                                f'{self.node.address} at {time(self.env)}: {orig_block_at_height.header.hash} no longer in main chain')
-                        # Delete from block index
-                        self.db.delete(key)
-                    # Add data for new blocks
-                    if i in new_chain:
-                        new_block_at_height = new_chain[i]
-                        if self.verbose:
-                            print(
-                                f'{self.node.address} at {time(self.env)}: {new_block_at_height.header.hash} now in main chain')
-                        # Add to block index
-                        self.db.put(key, new_block_at_height.header.hash)
-                    if i not in new_chain and not orig_at_height:
-                        break
+                            f'{self.node.address} at {time(self.env)}: {new_hash} now in main chain')
                 self._head_hash = block.header.hash
         # Block has no parent yet. An Orphan block
         else:
@@ -182,7 +121,7 @@ class Chain:
 
         self.add_child(block)
 
-        self.db.put(block.header.hash, block)
+        self.db.put_block(block)
 
         # Are there blocks that we received that were waiting for this block?
         # If so, process them.
@@ -0,0 +1,152 @@
+def _invert_lowest_one(n):
+    return n & (n - 1)
+
+
+def _skip_height(height):
+    """Height of the block that a block at `height` keeps as skip pointer. Following skip and
+    parent pointers, any ancestor is found in O(log(height)) steps (as in Bitcoin Core)"""
+    if height < 2:
+        return 0
+    if height & 1:
+        return _invert_lowest_one(_invert_lowest_one(height - 1)) + 1
+    return _invert_lowest_one(height)
+
+
+class BlockStore:
+    """Network-wide, content-addressed store of the blocks of a simulation (`env.blocks`).
+
+    Each block is stored once, whichever the number of nodes that know it, with its skip
+    pointer (see `_skip_height`) to find ancestors quickly, and the hashes of its children.
+    A block can only be added after its parent, except for the roots of the DAG (the genesis
+    block or the head restored from a previous day).
+    """
+
+    def __init__(self):
+        self.blocks = {}
+        self.skips = {}
+        self.children = {}
+
+    def __contains__(self, block_hash):
+        return block_hash in self.blocks
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def get(self, block_hash):
+        return self.blocks.get(block_hash)
+
+    def add(self, block):
+        """Adds a block (ignored if already stored)"""
+        block_hash = block.header.hash
+        if block_hash in self.blocks:
+            return
+        self.blocks[block_hash] = block
+        parent_hash = block.header.prevhash
+        if parent_hash in self.blocks:
+            self.skips[block_hash] = self.ancestor(parent_hash, _skip_height(block.header.number))
+            children = self.children.setdefault(parent_hash, [])
+            children.append(block_hash)
+
+    def merge(self, other):
+        """Adds the blocks of another store, parents first"""
+        for block in sorted(other.blocks.values(), key=lambda block: block.header.number):
+            self.add(block)
+
+    def ancestor(self, block_hash, number):
+        """Hash of the ancestor at height `number` of a stored block (itself included),
+        or `None` if it is not stored"""
+        blocks = self.blocks
+        block = blocks.get(block_hash)
+        if block is None:
+            return None
+        height = block.header.number
+        while height > number:
+            skip_hash = self.skips.get(block_hash)
+            skip_height = _skip_height(height)
+            skip_height_prev = _skip_height(height - 1)
+            if skip_hash is not None and (skip_height == number or (
+                    skip_height > number and not (
+                        skip_height_prev < skip_height - 2 and skip_height_prev >= number))):
+                block_hash = skip_hash
+                height = skip_height
+            else:
+                block_hash = blocks[block_hash].header.prevhash
+                if block_hash not in blocks:
+                    return None
+                height -= 1
+        return block_hash if height == number else None
+
+
+class ChainIndex:
+    """Typed index of the blocks known by the chain of a node, on top of a shared `BlockStore`.
+
+    The node only keeps its `head`: the main chain is made of the ancestors of the head,
+    found in the store. The other blocks known by the node (fork-specific ones) are kept in
+    the `forks` set, and the `scores` (AKA total difficulty in PoW) cached by the node are
+    computed only for the blocks involved in forks.
+    """
+
+    def __init__(self, store: BlockStore):
+        self.store = store
+        self.head = None
+        self.forks = set()
+        self.scores = {}
+
+    def attach(self, store: BlockStore):
+        """Moves the index to another store, e.g. the store of the world when restored"""
+        if store is not self.store:
+            store.merge(self.store)
+            self.store = store
+
+    def __contains__(self, block_hash):
+        """Tells if the node knows the block"""
+        if block_hash in self.forks:
+            return True
+        block = self.store.get(block_hash)
+        if block is None:
+            return False
+        return self.canonical_hash(block.header.number) == block_hash
+
+    def get_block(self, block_hash):
+        if block_hash in self:
+            return self.store.get(block_hash)
+        return None
+
+    def put_block(self, block):
+        """Stores a block known by the node"""
+        self.store.add(block)
+        if self.canonical_hash(block.header.number) != block.header.hash:
+            self.forks.add(block.header.hash)
+
+    def canonical_hash(self, number):
+        """Hash of the block of the main chain at height `number`, or `None`"""
+        if self.head is None or number < 0:
+            return None
+        return self.store.ancestor(self.head, number)
+
+    def set_head(self, block):
+        """Makes `block` the head of the main chain. Returns the hashes of the blocks that left
+        the main chain and the ones that joined it, from the common ancestor"""
+        self.store.add(block)
+        new_head = block.header.hash
+        old_head = self.head
+        self.head = new_head
+        if old_head is None or old_head == block.header.prevhash:
+            self.forks.discard(new_head)
+            return [], [new_head]
+        # Walk back both chains to the common ancestor
+        removed, added = [], []
+        old = self.store.get(old_head)
+        new = block
+        while old is not None and new is not None and old.header.hash != new.header.hash:
+            if old.header.number >= new.header.number:
+                removed.append(old.header.hash)
+                old = self.store.get(old.header.prevhash)
+            else:
+                added.append(new.header.hash)
+                new = self.store.get(new.header.prevhash)
+        self.forks.update(removed)
+        self.forks.difference_update(added)
+        removed.reverse()
+        added.reverse()
+        return removed, added
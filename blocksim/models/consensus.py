@@ -1,4 +1,4 @@
-from blocksim.utils import get_random_values
+from blocksim.utils import get_sampler
 
 
 class Consensus:
@@ -23,13 +23,13 @@ class Consensus:
     def validate_block(self, block=None):
         """ Simulates the block validation.
         For now, it only applies a delay in simulation, corresponding to previous measurements"""
-        delay = round(get_random_values(
-            self.env.delays['block_validation'])[0], 4)
+        delay = round(get_sampler(
+            self.env.delays['block_validation']).draw_one(), 4)
         return delay
 
     def validate_transaction(self, tx=None):
         """ Simulates the transaction validation.
         For now, it only calculates a delay in simulation, corresponding to previous measurements"""
-        delay = round(get_random_values(
-            self.env.delays['tx_validation'])[0], 4)
+        delay = round(get_sampler(
+            self.env.delays['tx_validation']).draw_one(), 4)
         return delay
@@ -18,6 +18,8 @@ class BlockHeader(BaseBlockHeader):
     :param str nonce: a nonce constituting a Proof-of-Work
     """
 
+    __slots__ = ('gas_limit', 'gas_used')
+
     def __init__(self,
                  prevhash=encode_hex(b'\x00' * 32),
                  number=0,
@@ -33,5 +35,7 @@ class BlockHeader(BaseBlockHeader):
 
 
 class Block(BaseBlock):
+    __slots__ = ()
+
     def __init__(self, header: BlockHeader, transactions=None):
         super().__init__(header, transactions)
@@ -2,7 +2,7 @@ from blocksim.models.node import Node
 from blocksim.models.network import Network
 from blocksim.models.chain import Chain
 from blocksim.models.consensus import Consensus
-from blocksim.models.db import BaseDB
+from blocksim.models.chain_index import ChainIndex
 from blocksim.models.transaction_queue import TransactionQueue
 from blocksim.utils import time
 from blocksim.models.ethereum.block import Block, BlockHeader
@@ -22,7 +22,7 @@ class ETHNode(Node):
         self.verbose = verbose
         genesis = Block(BlockHeader())
         consensus = Consensus(env)
-        chain = Chain(env, self, consensus, genesis, BaseDB())
+        chain = Chain(env, self, consensus, genesis, ChainIndex(env.blocks))
         self.hashrate = hashrate
         self.is_mining = is_mining
         super().__init__(env,
@@ -144,21 +144,17 @@ class ETHNode(Node):
         as known by each node"""
         yield self.connecting  # Wait for all connections
         yield self._handshaking  # Wait for handshaking to be completed
-        for node_address, node in self.active_sessions.items():
-            for tx in transactions:
-                # Checks if the transaction was previous sent
-                if any({tx.hash} & node.get('knownTxs')):
-                    if self.verbose:
-                        print(
-                            f'{self.address} at {time(self.env)}: Transaction {tx.hash[:8]} was already sent to {node_address}')
-                    transactions.remove(tx)
-                else:
-                    self._mark_transaction(tx.hash, node_address)
+        # Checks if the transactions were previously sent
+        unknown = self._unknown_transactions([tx.hash for tx in transactions])
+        if self.verbose and not unknown.all():
+            print(
+                f'{self.address} at {time(self.env)}: {len(transactions) - unknown.sum()} transactions were already sent')
+        transactions = [tx for tx, is_unknown in zip(transactions, unknown) if is_unknown]
         # Only send if it has transactions
         if transactions:
             if self.verbose:
                 print(
-                    f'{self.address} at {time(self.env)}: {len(transactions)} transactions ready to be sent')
+                    f'{self.address} at {time(self.env)}: {len(transactions)} transactions ready to be sent')
             transactions_msg = self.network_message.transactions(transactions)
             self.env.process(self.broadcast(transactions_msg))
 
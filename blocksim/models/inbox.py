@@ -0,0 +1,90 @@
+import heapq
+from blocksim.utils import get_received_delay
+
+# Stages of an envelope in the inbox queue
+ARRIVED = 0
+RECEIVED = 1
+
+
+class Inbox:
+    """Delivers all the envelopes sent to a `node` from a single process, instead of a SimPy
+    `Store` and a listening process for each connection (see `delivery` in the config).
+
+    Envelopes are kept in a priority queue ordered by simulated time. An envelope is pushed
+    when it is sent, with its upload and latency delays already added to its arrival time.
+    When it arrives the receive delay is added arithmetically: like the listening process of
+    its connection, the envelopes of a connection are received one after the other, in
+    their order of arrival, and only after the connection is open (the handshake is done).
+    """
+
+    def __init__(self, env, node):
+        self.env = env
+        self.node = node
+        self._queue = []
+        # Number of envelopes pushed, to keep the order of the ones with the same time
+        self._pushed = 0
+        # Time at which each open connection has received its last envelope
+        self._busy_until = {}
+        # Envelopes that arrived through a connection that is not open yet
+        self._waiting = {}
+        # Time of the next envelope the process is waiting for
+        self._next_time = float('inf')
+        self._wakeup = env.event()
+        env.process(self._run())
+
+    def put(self, connection, envelope, delay):
+        """Schedules the arrival of an `envelope` sent through `connection` in `delay` seconds"""
+        self._push(self.env.now + delay, ARRIVED, connection, envelope)
+
+    def open(self, connection):
+        """Starts receiving the envelopes of `connection`, including the ones already arrived"""
+        self._busy_until[connection] = self.env.now
+        for envelope in self._waiting.pop(connection, []):
+            self._receive(connection, envelope)
+
+    def envelopes(self):
+        """Returns the envelopes in the inbox, not received yet"""
+        waiting = [envelope for envelopes in self._waiting.values() for envelope in envelopes]
+        return [entry[-1] for entry in self._queue] + waiting
+
+    def resume(self):
+        """Starts the delivery process again, for an inbox restored from a checkpoint"""
+        self._next_time = float('inf')
+        self._wakeup = self.env.event()
+        self.env.process(self._run())
+
+    def _push(self, at, stage, connection, envelope):
+        heapq.heappush(self._queue, (at, self._pushed, stage, connection, envelope))
+        self._pushed += 1
+        if at < self._next_time and not self._wakeup.triggered:
+            self._wakeup.succeed()
+
+    def _receive(self, connection, envelope):
+        """Starts to receive an arrived envelope once the previous ones of its connection are received"""
+        start = max(self.env.now, self._busy_until[connection])
+        received_delay = get_received_delay(
+            self.env, envelope.msg['size'], envelope.origin.location_id, envelope.destination.location_id)
+        self._busy_until[connection] = start + received_delay
+        self._push(start + received_delay, RECEIVED, connection, envelope)
+
+    def _run(self):
+        while True:
+            if self._queue:
+                self._next_time = self._queue[0][0]
+                delay = self._next_time - self.env.now
+                if delay > 0:
+                    yield self.env.timeout(delay) | self._wakeup
+            else:
+                self._next_time = float('inf')
+                yield self._wakeup
+            if self._wakeup.triggered:
+                self._wakeup = self.env.event()
+
+            while self._queue and self._queue[0][0] <= self.env.now:
+                _, _, stage, connection, envelope = heapq.heappop(self._queue)
+                if stage == RECEIVED:
+                    self.node._receive_envelope(envelope)
+                elif connection in self._busy_until:
+                    self._receive(connection, envelope)
+                else:
+                    self._waiting.setdefault(connection, []).append(envelope)
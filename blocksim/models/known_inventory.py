@@ -0,0 +1,317 @@
+import math
+import sys
+from collections import OrderedDict
+import numpy as np
+from blocksim.models.transaction_table import TX_ID_DTYPE
+
+# Bytes of an entry of an `OrderedDict`, without its key (measured once)
+_ORDERED_DICT_ENTRY_NBYTES = sys.getsizeof(OrderedDict.fromkeys(range(4096))) / 4096
+# Bytes of a 64 bits key as a Python int
+_INT_KEY_NBYTES = sys.getsizeof(2 ** 63)
+
+
+class KnownCache:
+    """Bounded set of the items (e.g. block or transaction hashes) known by a peer.
+
+    When the cache is full, the least recently marked item is evicted.
+
+    :param capacity: maximum number of items kept
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._items = OrderedDict()
+        # Bytes of the keys that are not integers (e.g. hashes)
+        self._keys_nbytes = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, item):
+        return item in self._items
+
+    @property
+    def nbytes(self):
+        """Memory used by the cache in bytes, with its keys: hashes are shared with the
+        transactions, but the cache keeps them alive once the transactions are gone"""
+        return sys.getsizeof(self._items) + self._keys_nbytes
+
+    @staticmethod
+    def estimate_nbytes(capacity, count, key_nbytes=0):
+        """Estimates the memory a cache of `capacity` would use in bytes after `count` items
+        of `key_nbytes` bytes each were marked"""
+        return int(min(count, capacity) * (_ORDERED_DICT_ENTRY_NBYTES + key_nbytes))
+
+    def add(self, item):
+        """Marks an item as known"""
+        if item in self._items:
+            self._items.move_to_end(item)
+            return
+        self._items[item] = None
+        if not isinstance(item, int):
+            self._keys_nbytes += sys.getsizeof(item)
+        if len(self._items) > self.capacity:
+            evicted, _ = self._items.popitem(last=False)
+            if not isinstance(evicted, int):
+                self._keys_nbytes -= sys.getsizeof(evicted)
+
+    def add_many(self, items):
+        for item in items:
+            self.add(item)
+
+    def known_mask(self, items):
+        """Returns a boolean array telling which of the `items` are known"""
+        return np.fromiter((item in self._items for item in items), dtype=bool, count=len(items))
+
+    def filter_unknown(self, items):
+        """Returns the `items` that are not known, in the same order"""
+        return [item for item in items if item not in self._items]
+
+
+class KnownTxFilter:
+    """Bounded set of the transaction IDs (see `TransactionTable`) known by a peer.
+
+    IDs are kept in a ring buffer that grows up to `capacity`, overwriting the oldest ID when full,
+    and membership is a bit per transaction ID, so whole arrays of IDs are tested and
+    marked with vectorized operations.
+
+    The bits only cover the `span` IDs (8 per item of `capacity`) from a `base` ID. When a
+    newer ID does not fit, the base slides up and the IDs below it are forgotten, like the
+    ones evicted from the ring, so the memory used is at most `capacity` IDs and bytes.
+
+    :param capacity: maximum number of transaction IDs kept
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.span = 8 * capacity
+        self.base = 0
+        self._ring = np.empty(min(capacity, 1024), dtype=TX_ID_DTYPE)
+        self._position = 0
+        self._size = 0
+        self._bits = np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, tx_id):
+        return bool(self._test(np.array([tx_id], dtype=TX_ID_DTYPE))[0])
+
+    @property
+    def nbytes(self):
+        """Memory used by the filter in bytes"""
+        return self._ring.nbytes + self._bits.nbytes
+
+    @staticmethod
+    def estimate_nbytes(capacity, count, key_nbytes=0):
+        """Estimates the memory a filter of `capacity` would use in bytes after `count`
+        transaction IDs were marked, assuming the IDs are dense"""
+        count = min(count, capacity)
+        ring = min(capacity, 1024)
+        while ring < count:
+            ring = min(2 * ring, capacity)
+        return ring * np.dtype(TX_ID_DTYPE).itemsize + (count + 7) // 8
+
+    def _fit(self, tx_id):
+        """Grows the bit array to hold `tx_id`, sliding the base up if it is beyond the span"""
+        if tx_id - self.base >= self.span:
+            # Half of the span is left for the next IDs, and the base stays a multiple of 8
+            base = (int(tx_id) - self.span // 2 + 1) >> 3 << 3
+            shift = (base - self.base) >> 3
+            bits = np.zeros_like(self._bits)
+            if shift < len(bits):
+                bits[:len(bits) - shift] = self._bits[shift:]
+            self._bits = bits
+            self.base = base
+        length = (int(tx_id - self.base) >> 3) + 1
+        if length <= len(self._bits):
+            return
+        grown = np.zeros(min(max(2 * len(self._bits), length), self.span >> 3), dtype=np.uint8)
+        grown[:len(self._bits)] = self._bits
+        self._bits = grown
+
+    def known_mask(self, tx_ids):
+        """Returns a boolean array telling which of the transaction IDs `tx_ids` are known"""
+        return self._test(np.asarray(tx_ids, dtype=TX_ID_DTYPE))
+
+    def _grow(self, size):
+        """Grows the ring buffer to hold `size` IDs (up to `capacity`). It is only called
+        before the ring is full, while IDs are stored from the start of the buffer"""
+        if size <= len(self._ring) or len(self._ring) == self.capacity:
+            return
+        grown = np.empty(min(max(2 * len(self._ring), size), self.capacity), dtype=TX_ID_DTYPE)
+        grown[:self._size] = self._ring[:self._size]
+        self._ring = grown
+
+    def _test(self, tx_ids):
+        known = np.zeros(len(tx_ids), dtype=bool)
+        offsets = tx_ids - self.base
+        inside = (offsets >= 0) & ((offsets >> 3) < len(self._bits))
+        offsets = offsets[inside]
+        known[inside] = (self._bits[offsets >> 3] >> (offsets & 7)) & 1
+        return known
+
+    def _set(self, tx_ids, value):
+        """Sets the bits of the IDs `tx_ids`, which are within the span"""
+        offsets = tx_ids - self.base
+        masks = (1 << (offsets & 7)).astype(np.uint8)
+        if value:
+            np.bitwise_or.at(self._bits, offsets >> 3, masks)
+        else:
+            np.bitwise_and.at(self._bits, offsets >> 3, ~masks)
+
+    def add(self, tx_id):
+        """Marks a transaction ID as known"""
+        self.add_many(np.array([tx_id], dtype=TX_ID_DTYPE))
+
+    def add_many(self, tx_ids):
+        """Marks an array of transaction IDs as known, evicting the oldest ones if needed"""
+        tx_ids = np.asarray(tx_ids, dtype=TX_ID_DTYPE)
+        tx_ids = self.filter_unknown(tx_ids)
+        if len(tx_ids) > 1:
+            tx_ids, first = np.unique(tx_ids, return_index=True)
+            tx_ids = tx_ids[np.argsort(first)]
+        if len(tx_ids) == 0:
+            return
+        self._fit(tx_ids.max())
+        # Only the IDs within the span and the last `capacity` of them would survive
+        tx_ids = tx_ids[tx_ids >= self.base][-self.capacity:]
+        if len(tx_ids) == 0:
+            return
+        self._grow(self._size + len(tx_ids))
+        slots = (self._position + np.arange(len(tx_ids))) % self.capacity
+        # Slots beyond the size are free, the others hold the oldest IDs (forgotten if below the base)
+        evicted = self._ring[slots[slots < self._size]]
+        self._set(evicted[evicted >= self.base], False)
+        self._ring[slots] = tx_ids
+        self._set(tx_ids, True)
+        self._position = int(slots[-1] + 1) % self.capacity
+        self._size = min(self._size + len(tx_ids), self.capacity)
+
+    def filter_unknown(self, tx_ids):
+        """Returns the transaction IDs of the array `tx_ids` that are not known, in the same order"""
+        tx_ids = np.asarray(tx_ids, dtype=TX_ID_DTYPE)
+        return tx_ids[~self._test(tx_ids)]
+
+
+def _splitmix64(x):
+    """Scrambles an array of uint64 keys (overflows wrap around on purpose)"""
+    with np.errstate(over='ignore'):
+        x = x + np.uint64(0x9E3779B97F4A7C15)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+class BloomFilter:
+    """Bounded, approximate set of the transactions known by a peer, for transaction IDs or hashes.
+
+    Items are inserted in a Bloom filter sized for `capacity` items. When it is full it becomes
+    the previous generation, and a new empty filter takes its place, so about the last
+    `capacity` to `2 * capacity` items are remembered. Each generation is sized for half of
+    `false_positive_rate`, so that an item tested against both has that false positive rate.
+
+    A false positive means that an unknown item is taken as known, which suppresses
+    its propagation to the peer. With `exact_keys`, the keys of both generations are also
+    kept in sets, to tell the false positives apart (`false_positive_mask`) in the report,
+    at the cost of more memory than an exact cache.
+
+    :param capacity: number of items of each generation
+    :param false_positive_rate: probability of an unknown item being taken as known
+    :param exact_keys: keep the exact keys of the generations
+    """
+
+    def __init__(self, capacity: int, false_positive_rate: float, exact_keys=False):
+        self.capacity = capacity
+        self.false_positive_rate = false_positive_rate
+        rate = false_positive_rate / 2
+        self.num_bits = max(8, math.ceil(-capacity * math.log(rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self._current = np.zeros((self.num_bits + 7) // 8, dtype=np.uint8)
+        self._previous = np.zeros_like(self._current)
+        self._count = 0
+        self._exact_keys = (set(), set()) if exact_keys else None
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, item):
+        return bool(self.known_mask([item])[0])
+
+    @property
+    def nbytes(self):
+        """Memory used by the filter in bytes, with the exact keys if they are kept"""
+        nbytes = self._current.nbytes + self._previous.nbytes
+        if self._exact_keys is not None:
+            nbytes += sum(sys.getsizeof(keys) + len(keys) * _INT_KEY_NBYTES for keys in self._exact_keys)
+        return nbytes
+
+    @staticmethod
+    def _keys(items):
+        """Converts transaction IDs or hex hashes to uint64 keys"""
+        if isinstance(items, np.ndarray):
+            return items.astype(np.uint64)
+        return np.fromiter(
+            (int(item[:16], 16) if isinstance(item, str) else item for item in items),
+            dtype=np.uint64, count=len(items))
+
+    def _positions(self, items):
+        """Returns the (items x hashes) bit positions of the items, using double hashing"""
+        keys = self._keys(items)
+        h1 = _splitmix64(keys)
+        h2 = _splitmix64(keys ^ np.uint64(0x5851F42D4C957F2D)) | np.uint64(1)
+        steps = np.arange(self.num_hashes, dtype=np.uint64)
+        with np.errstate(over='ignore'):
+            return (h1[:, None] + steps * h2[:, None]) % np.uint64(self.num_bits)
+
+    @staticmethod
+    def _test(bits, positions):
+        return ((bits[positions >> np.uint64(3)] >> (positions & np.uint64(7))) & 1).all(axis=1)
+
+    def known_mask(self, items):
+        """Returns a boolean array telling which of the `items` are (probably) known"""
+        if len(items) == 0:
+            return np.zeros(0, dtype=bool)
+        positions = self._positions(items)
+        return self._test(self._current, positions) | self._test(self._previous, positions)
+
+    def false_positive_mask(self, items):
+        """Returns a boolean array telling which of the `items` are taken as known although
+        they were not added to the generations (it needs `exact_keys`)"""
+        known = self.known_mask(items)
+        current, previous = self._exact_keys
+        keys = self._keys(items).tolist()
+        return known & np.fromiter(
+            (key not in current and key not in previous for key in keys), dtype=bool, count=len(keys))
+
+    def filter_unknown(self, items):
+        """Returns the `items` that are not known, in the same order"""
+        known = self.known_mask(items)
+        if isinstance(items, np.ndarray):
+            return items[~known]
+        return [item for item, is_known in zip(items, known) if not is_known]
+
+    def add(self, item):
+        """Marks an item as known"""
+        self.add_many([item])
+
+    def add_many(self, items):
+        """Marks the `items` as known, starting a new generation each `capacity` items"""
+        if not isinstance(items, np.ndarray):
+            items = list(items)
+        start = 0
+        while start < len(items):
+            if self._count == self.capacity:
+                self._previous = self._current
+                self._current = np.zeros_like(self._previous)
+                self._count = 0
+                if self._exact_keys is not None:
+                    self._exact_keys = (set(), self._exact_keys[0])
+            end = start + self.capacity - self._count
+            if self._exact_keys is not None:
+                self._exact_keys[0].update(self._keys(items[start:end]).tolist())
+            positions = self._positions(items[start:end]).ravel()
+            masks = (np.uint64(1) << (positions & np.uint64(7))).astype(np.uint8)
+            np.bitwise_or.at(self._current, positions >> np.uint64(3), masks)
+            self._count += len(items[start:end])
+            start = end
@@ -13,6 +13,9 @@ class Network:
         self._list_nodes = []
         self._list_probabilities = []
         self.verbose = self.env.config["verbose"]
+        # Envelopes sent and received by the nodes, the difference is the messages in flight
+        self.messages_sent = 0
+        self.messages_received = 0
 
     def get_node(self, address):
         return self._nodes.get(address)
@@ -80,17 +83,25 @@ class Connection:
         self.destination_node = destination_node
         self.verbose = self.env.config["verbose"]
 
-    def latency(self, envelope):
-        latency_delay = get_latency_delay(
-            self.env, self.origin_node.location, self.destination_node.location)
-        yield self.env.timeout(latency_delay)
-        self.store.put(envelope)
+    def _deliver(self, event):
+        """Puts the envelope of a latency timeout in the store, when the timeout fires"""
+        self.store.put(event.value)
 
-    def put(self, envelope):
+    def put(self, envelope, delay=0):
+        """Sends an `envelope` through the connection, after waiting `delay` seconds
+        (e.g. the upload of the messages sent before it)"""
         if self.verbose:
             print(
                 f'{envelope.origin.address} at {envelope.timestamp}: Message (ID: {envelope.msg["id"]}) sent with {envelope.msg["size"]} MB with a destination: {envelope.destination.address}')
-        self.env.process(self.latency(envelope))
+        self.origin_node.network.messages_sent += 1
+        latency_delay = get_latency_delay(
+            self.env, self.origin_node.location_id, self.destination_node.location_id)
+        inbox = self.destination_node.inbox
+        if inbox is not None:
+            inbox.put(self, envelope, delay + latency_delay)
+        else:
+            # A timeout carries the envelope to the store, rather than a process per envelope
+            self.env.timeout(delay + latency_delay, envelope).callbacks.append(self._deliver)
 
     def get(self):
         return self.store.get()
@@ -1,7 +1,11 @@
+import sys
 from collections import namedtuple
+import numpy as np
 from blocksim.models.network import Connection, Network
 from blocksim.models.chain import Chain
 from blocksim.models.consensus import Consensus
+from blocksim.models.known_inventory import KnownCache, BloomFilter
+from blocksim.models.inbox import Inbox
 from blocksim.utils import get_received_delay, get_sent_delay, get_latency_delay, time
 
 Envelope = namedtuple('Envelope', 'msg, timestamp, destination, origin')
@@ -21,7 +25,8 @@ class Node:
     not any mechanism to discover nodes.
 
     To properly stimulate a real world scenario, the node model needs to know the geographic
-    `location`.
+    `location`. The `location_id` is the index of the location in the delay matrices
+    compiled by the world.
 
     In order to a node to be identified in the network simulation, is needed to have an `address`
     """
@@ -36,7 +41,10 @@ class Node:
         self.env = env
         self.network = network
         self.location = location
+        self.location_id = env.location_ids[location]
         self.address = address
+        # Index of the node in the propagation metrics
+        self.node_index = env.propagation.add_node(address)
         self.chain = chain
         self.consensus = consensus
         self.active_sessions = {}
@@ -47,6 +55,23 @@ class Node:
         key = f'forks_{address}'
         self.env.data[key] = 0
         self.verbose = self.env.config["verbose"]
+        # Transactions already broadcast, which the peers know. Every broadcast goes to all
+        # the sessions, so they share one inventory
+        self._known_inventory = self.env.config.get('known_inventory', {})
+        self._known_txs = self._new_known_txs()
+        # With `track_false_positives`, a Bloom filter keeps its exact keys and an exact cache
+        # is also filled, to count the spurious suppressions and the memory of the exact cache
+        self._exact_txs = None
+        if isinstance(self._known_txs, BloomFilter) and self._known_inventory.get('track_false_positives', False):
+            self._exact_txs = self._new_exact_known_txs()
+        # Transactions marked as known, to estimate the memory of the exact cache otherwise
+        self._known_txs_count = 0
+        self._known_txs_nbytes = 0
+        self._exact_txs_nbytes = 0
+        # With the `inbox` delivery, the envelopes of all connections are received by one process
+        self.inbox = None
+        if self.env.config.get('delivery', 'connections') == 'inbox':
+            self.inbox = Inbox(env, self)
 
     def connect(self, nodes: list):
         """Simulate an acknowledgement phase with given nodes. During simulation the nodes
@@ -56,16 +81,9 @@ class Node:
             if node.address != self.address:
                 connection = Connection(self.env, self, node)
 
-                # Set the bases to monitor the block & TX propagation
-                self.env.data['block_propagation'].update({
-                    f'{self.address}_{node.address}': {}})
-                self.env.data['tx_propagation'].update({
-                    f'{self.address}_{node.address}': {}})
-
                 self.active_sessions[node.address] = {
                     'connection': connection,
-                    'knownTxs': {''},
-                    'knownBlocks': {''}
+                    'knownBlocks': KnownCache(MAX_KNOWN_BLOCKS)
                 }
                 self.connecting = self.env.process(
                     self._connecting(node, connection))
@@ -79,33 +97,76 @@ class Node:
         origin_node = connection.origin_node
         destination_node = connection.destination_node
         latency = get_latency_delay(
-            self.env, origin_node.location, destination_node.location)
+            self.env, origin_node.location_id, destination_node.location_id)
         tcp_handshake_delay = 3*latency
         yield self.env.timeout(tcp_handshake_delay)
-        self.env.process(destination_node.listening_node(connection))
-
-    def _mark_block(self, block_hash: str, node_address: str):
-        """Marks a block as known for a specific node, ensuring that it will never be
-        propagated again."""
-        node = self.active_sessions.get(node_address)
-        known_blocks = node.get('knownBlocks')
-        while len(known_blocks) >= MAX_KNOWN_BLOCKS:
-            known_blocks.pop()
-        known_blocks.add(block_hash)
-        node['knownBlocks'] = known_blocks
-        self.active_sessions[node_address] = node
-
-    def _mark_transaction(self, tx_hash: str, node_address: str):
-        """Marks a transaction as known for a specific node, ensuring that it will never be
-        propagated again."""
-        node = self.active_sessions.get(node_address)
-        known_txs = node.get('knownTxs')
-        while len(known_txs) >= MAX_KNOWN_TXS:
-            known_txs.pop()
-        known_txs.add(tx_hash)
-        node['knownTxs'] = known_txs
-        self.active_sessions[node_address] = node
+        if destination_node.inbox is not None:
+            destination_node.inbox.open(connection)
+        else:
+            self.env.process(destination_node.listening_node(connection))
+
+    def _new_known_txs(self):
+        """Creates the cache of the transactions known by the peers, an exact cache or a
+        Bloom filter as selected by `known_inventory` in the config. The Bloom filter keeps
+        the exact keys of its generations to count its false positives if
+        `track_false_positives` is set"""
+        if self._known_inventory.get('mode', 'exact') == 'bloom':
+            return BloomFilter(
+                MAX_KNOWN_TXS, self._known_inventory.get('false_positive_rate', 0.001),
+                exact_keys=self._known_inventory.get('track_false_positives', False))
+        return self._new_exact_known_txs()
+
+    def _new_exact_known_txs(self):
+        return KnownCache(MAX_KNOWN_TXS)
+
+    def _estimate_exact_known_txs_nbytes(self, count, key):
+        """Estimates the memory the exact cache would use after `count` transaction keys
+        like `key` were marked"""
+        return KnownCache.estimate_nbytes(
+            MAX_KNOWN_TXS, count, sys.getsizeof(key) if isinstance(key, str) else 0)
+
+    def _unknown_transactions(self, keys):
+        """Returns a boolean array telling which transaction `keys` (hashes or IDs) are not
+        known by the peers, and marks them as known.
 
+        The memory used by the known transactions and the number of transactions suppressed
+        by Bloom filter false positives are monitored in `known_inventory`. Unless
+        `track_false_positives` is set, the suppressions are estimated from the false positive
+        rate, and the memory of the exact cache from the number of transactions marked."""
+        known_txs = self._known_txs
+        unknown = ~known_txs.known_mask(keys)
+        if isinstance(keys, np.ndarray):
+            unknown_keys = keys[unknown]
+        else:
+            unknown_keys = [key for key, is_unknown in zip(keys, unknown) if is_unknown]
+        monitor = self.env.data['known_inventory']
+        if self._exact_txs is not None:
+            monitor['spurious_suppressions'] += int(np.count_nonzero(known_txs.false_positive_mask(keys)))
+            self._exact_txs.add_many(unknown_keys)
+        elif isinstance(known_txs, BloomFilter):
+            # Each unknown transaction is taken as known with the false positive rate
+            rate = known_txs.false_positive_rate
+            monitor['spurious_suppressions'] += len(unknown_keys) * rate / (1 - rate)
+        known_txs.add_many(unknown_keys)
+        self._known_txs_count += len(unknown_keys)
+
+        if self._exact_txs is not None:
+            exact_txs_nbytes = self._exact_txs.nbytes
+            # The exact keys and cache kept to count the false positives are memory used too
+            known_txs_nbytes = known_txs.nbytes + exact_txs_nbytes
+        elif isinstance(known_txs, BloomFilter):
+            known_txs_nbytes = known_txs.nbytes
+            exact_txs_nbytes = self._exact_txs_nbytes
+            if len(unknown_keys) > 0:
+                exact_txs_nbytes = self._estimate_exact_known_txs_nbytes(self._known_txs_count, unknown_keys[0])
+        else:
+            known_txs_nbytes = exact_txs_nbytes = known_txs.nbytes
+        monitor['memory_bytes'] += known_txs_nbytes - self._known_txs_nbytes
+        self._known_txs_nbytes = known_txs_nbytes
+        monitor['exact_memory_bytes'] += exact_txs_nbytes - self._exact_txs_nbytes
+        self._exact_txs_nbytes = exact_txs_nbytes
+        monitor['memory_saved_bytes'] = monitor['exact_memory_bytes'] - monitor['memory_bytes']
+        return unknown
 
     def _read_envelope(self, envelope):
         if self.verbose:
@@ -116,39 +177,29 @@ class Node:
         while True:
             # Get the messages from  connection
             envelope = yield connection.get()
-            origin_loc = envelope.origin.location
-            dest_loc = envelope.destination.location
+            origin_loc = envelope.origin.location_id
+            dest_loc = envelope.destination.location_id
             message_size = envelope.msg['size']
             received_delay = get_received_delay(
                 self.env, message_size, origin_loc, dest_loc)
             yield self.env.timeout(received_delay)
+            self._receive_envelope(envelope)
 
-            # Monitor the transaction propagation on Ethereum
-            if envelope.msg['id'] == 'transactions':
-                tx_propagation = self.env.data['tx_propagation'][
-                    f'{envelope.origin.address}_{envelope.destination.address}']
-                txs = {}
-                for tx in envelope.msg['transactions']:
-                    initial_time = tx_propagation.get(tx.hash[:8], None)
-                    if initial_time is not None:
-                        propagation_time = self.env.now - initial_time
-                        txs.update({f'{tx.hash[:8]}': propagation_time})
-                self.env.data['tx_propagation'][f'{envelope.origin.address}_{envelope.destination.address}'].update(
-                    txs)
-            # Monitor the block propagation on Ethereum
-            if envelope.msg['id'] == 'block_bodies':
-                block_propagation = self.env.data['block_propagation'][
-                    f'{envelope.origin.address}_{envelope.destination.address}']
-                blocks = {}
-                for block_hash, _ in envelope.msg['block_bodies'].items():
-                    initial_time = block_propagation.get(block_hash[:8], None)
-                    if initial_time is not None:
-                        propagation_time = self.env.now - initial_time
-                        blocks.update({f'{block_hash[:8]}': propagation_time})
-                self.env.data['block_propagation'][f'{envelope.origin.address}_{envelope.destination.address}'].update(
-                    blocks)
-
-            self._read_envelope(envelope)
+    def _receive_envelope(self, envelope):
+        """Handles an envelope once it is fully received"""
+        self.network.messages_received += 1
+        origin = envelope.origin.node_index
+        destination = envelope.destination.node_index
+        # Monitor the transaction propagation on Ethereum
+        if envelope.msg['id'] == 'transactions':
+            self.env.propagation.received(
+                'tx', origin, destination, envelope.msg.get('propagation_key'), self.env.now)
+        # Monitor the block propagation on Ethereum
+        if envelope.msg['id'] == 'block_bodies':
+            for block_hash in envelope.msg['block_bodies']:
+                self.env.propagation.received('block', origin, destination, block_hash, self.env.now)
+
+        self._read_envelope(envelope)
 
     def send(self, destination_address: str, msg):
         if self.address == destination_address:
@@ -180,7 +231,7 @@ class Node:
             yield self.env.timeout(delay)
 
         upload_transmission_delay = get_sent_delay(
-            self.env, msg['size'], origin_node.location, destination_node.location)
+            self.env, msg['size'], origin_node.location_id, destination_node.location_id)
         yield self.env.timeout(upload_transmission_delay)
 
         envelope = Envelope(msg, time(self.env), destination_node, origin_node)
@@ -193,23 +244,20 @@ class Node:
             origin_node = connection.origin_node
             destination_node = connection.destination_node
 
+            origin = origin_node.node_index
+            destination = destination_node.node_index
             # Monitor the transaction propagation on Ethereum
             if msg['id'] == 'transactions':
-                txs = {}
-                for tx in msg['transactions']:
-                    txs.update({f'{tx.hash[:8]}': self.env.now})
-                self.env.data['tx_propagation'][f'{origin_node.address}_{destination_node.address}'].update(
-                    txs)
+                self.env.propagation.sent(
+                    'tx', origin, destination, self.env.propagation.message_key(msg), self.env.now,
+                    len(msg['transactions']))
             # Monitor the block propagation on Ethereum
             if msg['id'] == 'new_blocks':
-                blocks = {}
                 for block_hash in msg['new_blocks']:
-                    blocks.update({f'{block_hash[:8]}': self.env.now})
-                self.env.data['block_propagation'][f'{origin_node.address}_{destination_node.address}'].update(
-                    blocks)
+                    self.env.propagation.sent('block', origin, destination, block_hash, self.env.now)
 
             upload_transmission_delay = get_sent_delay(
-                self.env, msg['size'], origin_node.location, destination_node.location)
+                self.env, msg['size'], origin_node.location_id, destination_node.location_id)
             yield self.env.timeout(upload_transmission_delay)
             envelope = Envelope(msg, time(self.env),
                                 destination_node, origin_node)
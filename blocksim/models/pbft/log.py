@@ -0,0 +1,176 @@
+def _missing():
+    return None
+
+
+class SeqnoLog:
+    """Entries of one kind of the pBFT log (e.g. the prepares), keyed by sequence number.
+
+    Entries are kept in a ring buffer of `window` slots, the entry of `seqno` being in the slot
+    `seqno % window`, so only the sequence numbers between the low watermark `low` and the high
+    watermark `low + window` are logged: the others are ignored. Moving the low watermark up
+    (`truncate`) drops everything below it at once, and the memory used stays O(window)
+    whichever the number of sequence numbers.
+
+    Reading a missing entry does not create it: `get` and `[]` return a new `default()`, and
+    `entry` creates it in the log.
+
+    :param window: number of sequence numbers logged
+    :param default: factory of the value of a missing entry (e.g. `set` or `bool`)
+    """
+
+    def __init__(self, window: int, default=_missing):
+        self.window = window
+        self.default = default
+        self.low = 0
+        # Number of sequence numbers ever logged
+        self.added = 0
+        self._seqnos = [None] * window
+        self._values = [None] * window
+
+    @property
+    def high(self):
+        return self.low + self.window
+
+    def in_window(self, seqno):
+        return self.low <= seqno < self.low + self.window
+
+    def __contains__(self, seqno):
+        return self.in_window(seqno) and self._seqnos[seqno % self.window] == seqno
+
+    def __len__(self):
+        return sum(1 for seqno in self._seqnos if seqno is not None and seqno >= self.low)
+
+    def __iter__(self):
+        """Sequence numbers logged, in order"""
+        return iter(sorted(seqno for seqno in self._seqnos if seqno is not None and seqno >= self.low))
+
+    def get(self, seqno):
+        if seqno in self:
+            return self._values[seqno % self.window]
+        return self.default()
+
+    __getitem__ = get
+
+    def __setitem__(self, seqno, value):
+        if not self.in_window(seqno):
+            return
+        slot = seqno % self.window
+        if self._seqnos[slot] != seqno:
+            self._seqnos[slot] = seqno
+            self.added += 1
+        self._values[slot] = value
+
+    def entry(self, seqno):
+        """Returns the entry of `seqno`, created if missing. Out of the window, the entry
+        is a new `default()` that is not logged"""
+        if seqno not in self:
+            value = self.default()
+            self[seqno] = value
+            return value
+        return self._values[seqno % self.window]
+
+    def truncate(self, low):
+        """Moves the low watermark up to `low`, dropping the entries below it"""
+        if low <= self.low:
+            return
+        if low - self.low >= self.window:
+            self._seqnos = [None] * self.window
+            self._values = [None] * self.window
+        else:
+            for seqno in range(self.low, low):
+                slot = seqno % self.window
+                if self._seqnos[slot] == seqno:
+                    self._seqnos[slot] = None
+                    self._values[slot] = None
+        self.low = low
+
+
+class Votes:
+    """Replicas that voted for a sequence number (e.g. its prepares), as a bitset over their
+    `replica_id`. The number of votes (the popcount of the bitset) is kept along, so a quorum
+    is checked in O(1) on every message."""
+
+    __slots__ = ('mask', 'count')
+
+    def __init__(self):
+        self.mask = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, replica_id):
+        return bool(self.mask >> replica_id & 1)
+
+    def add(self, replica_id):
+        """Adds the vote of a replica. Returns `True` if it did not vote yet"""
+        bit = 1 << replica_id
+        if self.mask & bit:
+            return False
+        self.mask |= bit
+        self.count += 1
+        return True
+
+
+class CheckpointLog:
+    """Latest checkpoint announced by each replica, which tells the stable checkpoint.
+
+    A checkpoint at a sequence number vouches for the ones before it, so a sequence number is
+    stable once `quorum` replicas announced a checkpoint at or after it. Only one sequence
+    number per replica is kept.
+    """
+
+    def __init__(self):
+        self.replicas = {}
+
+    def __len__(self):
+        return len(self.replicas)
+
+    def add(self, replica_id, seqno):
+        if seqno > self.replicas.get(replica_id, -1):
+            self.replicas[replica_id] = seqno
+
+    def voters(self, seqno):
+        """Replicas that announced a checkpoint at or after `seqno`"""
+        return {replica_id for replica_id, announced in self.replicas.items() if announced >= seqno}
+
+    def stable(self, quorum: int):
+        """Highest sequence number vouched for by `quorum` replicas, or `None`"""
+        if quorum <= 0 or len(self.replicas) < quorum:
+            return None
+        return sorted(self.replicas.values(), reverse=True)[quorum - 1]
+
+
+class PBFTLog(dict):
+    """The pBFT log of a node: one `SeqnoLog` per kind of message, with the same window.
+
+    `block`, `prepare`, `prepared`, `commit` and `committed` are keyed by sequence number,
+    `viewchange` and `newview` by view, `reply` by block number (on the nodes that are not
+    authorities), and `checkpoint` is a `CheckpointLog`. Prepares and commits are `Votes`,
+    replies are the `Votes` of each block hash (two blocks can have the same number), and
+    `certified` has the phases certified by the node as a vote collector.
+    """
+
+    def __init__(self, window: int):
+        super().__init__(
+            block=SeqnoLog(window, bool),
+            prepare=SeqnoLog(window, Votes),
+            prepared=SeqnoLog(window, bool),
+            commit=SeqnoLog(window, Votes),
+            committed=SeqnoLog(window, bool),
+            reply=SeqnoLog(window, dict),
+            viewchange=SeqnoLog(window, list),
+            checkpoint=CheckpointLog(),
+            newview=SeqnoLog(window, set),
+            certified=SeqnoLog(window, set))
+        self.window = window
+
+    def truncate(self, seqno):
+        """Drops the entries of the sequence numbers below `seqno` (a stable checkpoint)"""
+        for kind in ('block', 'prepare', 'prepared', 'commit', 'committed', 'certified'):
+            self[kind].truncate(seqno)
+
+    def truncate_views(self, view):
+        """Drops the view changes and new views of the views below `view`"""
+        self['viewchange'].truncate(view)
+        self['newview'].truncate(view)
@@ -101,6 +101,20 @@ class Message:
             'size': kB_to_MB(self._message_size['commit'])
         }
     
+    def certificate(self, phase, seqno, votes):
+        """Aggregated (threshold) signature of the `votes` of a `phase` ('prepare' or 'commit'),
+        multicast by the collector in the `collector` vote mode. Its size is the one of a
+        single vote unless `certificate` is set in `message_size_kB`"""
+        return {
+            'id': f'{phase}-certificate',
+            'view': self.origin_node.network.view,
+            'seqno': seqno,
+            'digest': self.digest,
+            'replica_id': self.origin_node.replica_id,
+            'signers': votes.mask,
+            'size': kB_to_MB(self._message_size.get('certificate', self._message_size[phase]))
+        }
+
     def client_reply(self, new_block):
         return {
             'id': 'reply',
@@ -3,20 +3,24 @@ from blocksim.models.permissioned_node import PermNode as Node
 from blocksim.models.pbft_network import PBFTNetwork as Network, MaliciousModel
 from blocksim.models.chain import Chain
 from blocksim.models.consensus import Consensus
-from blocksim.models.db import BaseDB
+from blocksim.models.chain_index import ChainIndex
 from blocksim.models.permissoned_transaction_queue import TransactionQueue
-from blocksim.utils import time, get_random_values
+from blocksim.models.transaction_table import TX_ID_DTYPE
+from blocksim.utils import time, timeout_at
 from blocksim.models.block import Block, BlockHeader
 from blocksim.models.pbft.message import Message
-from collections import defaultdict
-from pathlib import Path
+from blocksim.models.pbft.log import PBFTLog, SeqnoLog, Votes
+from blocksim.models.block_policy import network_block_policy
 from scipy import random
-import pickle
+import numpy as np
 
 Envelope = namedtuple('Envelope', 'msg, timestamp, destination, origin')
 
 
 class PBFTNode(Node):
+    # Attributes set from the config, kept when a what-if branch restores a checkpoint
+    CONFIG_ATTRIBUTES = (
+        'is_malicious', 'drop_probability', 'timeoutVal', 'vote_mode', 'pipeline_depth', 'block_policy')
 
     def __init__(self,
                  env,
@@ -31,7 +35,7 @@ class PBFTNode(Node):
         # Create the PBFT genesis block and init the chain
         genesis = Block(BlockHeader())
         consensus = Consensus(env)
-        chain = Chain(env, self, consensus, genesis, BaseDB())
+        chain = Chain(env, self, consensus, genesis, ChainIndex(env.blocks))
 
         self.is_authority = is_authority
         super().__init__(env,
@@ -50,6 +54,8 @@ class PBFTNode(Node):
             # Transaction Queue to store the transactions
             self.transaction_queue = TransactionQueue(
                 env, self, self.consensus)
+            # Number of transactions of the queue put in each block
+            self.block_policy = network_block_policy(self.network, self.env.config['pbft'])
             self.env.process(self._check_timeout())  # When node is initialized, begin periodically checking for timeout
             self.env.process(
                 self._checkpointing())  # When node is initialized, periodically check if a checkpoint should be taken
@@ -60,24 +66,22 @@ class PBFTNode(Node):
         self._handshaking = env.event()
         self.replica_id = replica_id
         # Jiali: a dict for logging msg/prepare/commit
-        self.log = {
-            'block': defaultdict(bool),
-            'prepare': defaultdict(set),
-            'prepared': defaultdict(bool),
-            'commit': defaultdict(set),
-            'committed': defaultdict(bool),
-            'reply': defaultdict(set),
-            'viewchange': defaultdict(list),  # TODO, correct for multiple occurrences
-            'checkpoint': defaultdict(set),
-            'newview': defaultdict(set)
-        }
+        # Only the sequence numbers between the stable checkpoint and `log_window` after it are logged
+        log_window = self.env.config['pbft'].get('log_window', 256)
+        self.log = PBFTLog(log_window)
         # A dict to store the actual prepare messages.They should be identical
         # per seqno. update when a valid prepare message is received.
-        self.preparemsg = {}
+        self.preparemsg = SeqnoLog(log_window)
 
         # Ryan: We want to model node failures and view changes...
         self.timedout = False  # Indicate if a node has timed out
-        self.timeoutVal = 3  # Some numerical time value for a timeout here
+        self.timeoutVal = self.env.config['pbft'].get('timeout', 3)  # Some numerical time value for a timeout here
+        # `all_to_all`: prepares and commits are broadcast to all authorities (O(n²) messages per block)
+        # `collector`: they are sent to the primary, which multicasts one certificate per phase (O(n))
+        self.vote_mode = self.env.config['pbft'].get('vote_mode', 'all_to_all')
+        # Number of pre-prepares the primary can have in flight (not executed yet), `None` to
+        # always build on the head of its chain
+        self.pipeline_depth = self.env.config['pbft'].get('pipeline_depth')
         self.failure = False  # Indicate if a node is down or will somehow act Byzantine
         # self.prevLog = {}  # Keep track of previous log state so node can detect changes to it
         self.currSeqno = 0
@@ -96,25 +100,20 @@ class PBFTNode(Node):
             if drop_message:
                 return True
 
-        block_size = self.env.config['pbft']['block_size_limit_mb']
-        transactions_per_block_dist = self.env.config[
-            'pbft']['number_transactions_per_block']
-        transactions_per_block = int(
-            get_random_values(transactions_per_block_dist)[0])
-        pending_txs = []
-        tx_left = True
-        for i in range(transactions_per_block * block_size):
-            if self.transaction_queue.is_empty():
-                if self.verbose:
-                    print(
-                        f'{self.address} at {time(self.env)}: No more transactions queued.')
-                # Jiali: stop simulation when tx are done, in order to know whether/when it happens
-                # raise Exception('TX all processed')
-                tx_left = False if i == 0 else True
-                break
-            pending_tx = self.transaction_queue.get()
-            pending_txs.append(pending_tx)
-        candidate_block = self._build_candidate_block(pending_txs)
+        prev_block = self._pipeline_parent()
+        if prev_block is None:
+            # The pipeline is full, wait for the blocks in flight to be executed
+            return True
+
+        pending_txs, queued_at = self.transaction_queue.take(self.block_policy.block_size_for(self))
+        # Jiali: stop simulation when tx are done, in order to know whether/when it happens
+        tx_left = len(pending_txs) > 0
+        if self.transaction_queue.is_empty() and self.verbose:
+            print(
+                f'{self.address} at {time(self.env)}: No more transactions queued.')
+        candidate_block = self._build_candidate_block(pending_txs, prev_block)
+        self.env.tx_lifecycle.mark('queued', pending_txs, queued_at)
+        self.env.tx_lifecycle.mark('pre_prepared', pending_txs, self.env.now)
         if self.verbose:
             print(
                 f'{self.address} at {time(self.env)}: New candidate block #{candidate_block.header.number} created {candidate_block.header.hash[:8]} with difficulty {candidate_block.header.difficulty}')
@@ -125,10 +124,32 @@ class PBFTNode(Node):
         self.broadcast_pre_prepare([candidate_block])
         return tx_left
 
-    def _build_candidate_block(self, pending_txs):
+    def _pipeline_parent(self):
+        """Block the next pre-prepare builds on. Without pipelining it is the head of the chain.
+        With a `pipeline_depth`, it is the last block proposed by the node while it extends the
+        head, or `None` when `pipeline_depth` proposals are already in flight"""
+        head = self.chain.head
+        if self.pipeline_depth is None:
+            return head
+        parent = self.log['block'][self.currSeqno]
+        if not parent or parent.header.number <= head.header.number:
+            return head
+        # The proposals in flight must extend the head (they are dropped by a view change)
+        block = parent
+        while block and block.header.number > head.header.number + 1:
+            previous = self.log['block'][block.header.number - 1]
+            block = previous if previous and previous.header.hash == block.header.prevhash else None
+        if not block or block.header.prevhash != head.header.hash:
+            return head
+        if parent.header.number - head.header.number >= self.pipeline_depth:
+            return None
+        return parent
+
+    def _build_candidate_block(self, pending_txs, prev_block=None):
         # Jiali: This function is borrowed from bitcoin/node.py, without any change actually.
         # Get the current head block
-        prev_block = self.chain.head
+        if prev_block is None:
+            prev_block = self.chain.head
         coinbase = self.address
         timestamp = self.env.now
         difficulty = self.consensus.calc_difficulty(prev_block, timestamp)
@@ -167,6 +188,10 @@ class PBFTNode(Node):
                 self._receive_prepare(envelope)
             if envelope.msg['id'] == 'commit':
                 self._receive_commit(envelope)
+            if envelope.msg['id'] == 'prepare-certificate':
+                self._receive_prepare_certificate(envelope)
+            if envelope.msg['id'] == 'commit-certificate':
+                self._receive_commit_certificate(envelope)
             if envelope.msg['id'] == 'checkpoint':
                 self._receive_checkpoint_message(envelope)
             # Only the prospective next view primary should care about a viewchange
@@ -214,18 +239,16 @@ class PBFTNode(Node):
         as known by each node"""
         yield self.connecting  # Wait for all connections
         # yield self._handshaking  # Wait for handshaking to be completed
-        for node_address, node in self.active_sessions.items():
-            for tx in transactions:
-                # Checks if the transaction was previous sent
-                if any({tx.hash} & node.get('knownTxs')):
-                    if self.verbose:
-                        print(
-                            f'{self.address} at {time(self.env)}: Transaction {tx.hash[:8]} was already sent to {node_address}')
-                    transactions.remove(tx)
-                else:
-                    self._mark_transaction(tx.hash, node_address)
+        # Transactions are IDs in the world transaction table
+        transactions = np.asarray(transactions, dtype=TX_ID_DTYPE)
+        # Checks if the transactions were previously sent
+        unknown = self._unknown_transactions(transactions)
+        if self.verbose and not unknown.all():
+            print(
+                f'{self.address} at {time(self.env)}: {len(transactions) - unknown.sum()} transactions were already sent')
+        transactions = transactions[unknown]
         # Only send if it has transactions
-        if transactions:
+        if len(transactions) > 0:
             if self.verbose:
                 print(
                     f'{self.address} at {time(self.env)}: {len(transactions)} transactions ready to be sent')
@@ -235,12 +258,8 @@ class PBFTNode(Node):
     def _receive_full_transactions(self, envelope):
         """Handle full tx received. If node is authority store transactions in a pool (ordered by the gas price)"""
         transactions = envelope.msg.get('transactions')
-        valid_transactions = []
-        for tx in transactions:
-            if self.is_authority:
-                self.transaction_queue.put(tx)
-            else:
-                valid_transactions.append(tx)
+        if self.is_authority:
+            self.transaction_queue.add_txs(transactions)
         # self.env.process(self.broadcast_transactions(valid_transactions))
 
     ##              ##
@@ -274,6 +293,10 @@ class PBFTNode(Node):
 
         if not self.validate_message_digest(envelope.msg):
             return
+        # Watermarks: only the sequence numbers in the window of the log above the stable
+        # checkpoint are accepted
+        if not self.log['block'].in_window(seqno):
+            return
 
         if (envelope.msg['new_blocks'] == None) and (envelope.msg['block_bodies'] == None):
             self.log['block'][seqno] = None
@@ -289,15 +312,15 @@ class PBFTNode(Node):
             # Jiali: store the block in the log for future commit
             block = Block(block_header, block_bodies[block_hash])
             self.log['block'][seqno] = block
+            # The block was prepared before its pre-prepare arrived
+            if self.log['prepared'][seqno]:
+                self.network.block_prepared(block)
             if self.verbose:
                 print('TIME IS ' + time(self.env))
 
+            # The block was committed before its pre-prepare arrived
             if self.log['committed'][seqno] and self.chain.get_block(block_hash) is None:
-                new_block = self.log['block'][seqno]
-                self.chain.add_block(new_block)
-                if self.verbose:
-                    print(
-                        f'{self.address} at {time(self.env)}: Block assembled and added to the top of the chain  {new_block.header}')
+                self._execute_block(block)
 
     def _send_prepare(self, envelop):
         # Send prepare
@@ -308,7 +331,12 @@ class PBFTNode(Node):
             print(
                 f'{self.address} at {time(self.env)}: Prepare prepared to multicast.')
         prepare_msg = self.network_message.prepare(seqno)
-        self.log['prepare'][seqno].add(self.address)
+        if self.vote_mode == 'collector':
+            # The vote goes to the primary that sent the pre-prepare (none for the local ones of a new view)
+            if envelop.origin is not None:
+                self.env.process(self._send_vote(envelop.origin.address, prepare_msg))
+            return
+        self.log['prepare'].entry(seqno).add(self.replica_id)
         self.env.process(self.broadcast_to_authorities(prepare_msg))
 
     def _receive_prepare(self, envelope):
@@ -317,19 +345,36 @@ class PBFTNode(Node):
         if not self.validate_message_digest(envelope.msg):
             return
         seqno = envelope.msg.get('seqno')
-        self.log['prepare'][seqno].add(envelope.origin.address)
+        prepares = self.log['prepare'].entry(seqno)
+        prepares.add(envelope.msg['replica_id'])
         self.preparemsg[seqno] = envelope.msg
-        # Replica multicasts a COMMIT to the other replicas when prepared becomes true.
-        if len(self.log['prepare'][seqno]) >= 2 * self.network.f:
-            self.log['prepared'][seqno] = True
+        if self.vote_mode == 'collector':
+            # The collector multicasts the prepare certificate once, and votes the commit itself
+            if len(prepares) >= 2 * self.network.f and self._certify(seqno, 'prepare'):
+                self._prepared(seqno)
+                self.log['commit'].entry(seqno).add(self.replica_id)
+                self._check_committed(seqno)
+            return
+        # Replica multicasts a COMMIT to the other replicas when prepared becomes true (once).
+        if len(prepares) >= 2 * self.network.f and not self.log['prepared'][seqno]:
+            self._prepared(seqno)
             self._send_commit(seqno)
+            # The commits may have reached their quorum before
+            self._check_committed(seqno)
+
+    def _prepared(self, seqno):
+        """prepared becomes true, which is reported to the network when the block is known"""
+        self.log['prepared'][seqno] = True
+        block = self.log['block'][seqno]
+        if block:
+            self.network.block_prepared(block)
 
     def _send_commit(self, seqno):
         """Request a node (identified by the `destination_address`) to return block bodies.
         Specify a list of `hashes` that we're interested in.
         """
         commit_msg = self.network_message.commit(seqno)
-        self.log['commit'][seqno].add(self.address)
+        self.log['commit'].entry(seqno).add(self.replica_id)
         self.env.process(self.broadcast_to_authorities(commit_msg))
 
     def _receive_commit(self, envelope):
@@ -340,24 +385,80 @@ class PBFTNode(Node):
         if not self.validate_message_digest(envelope.msg):
             return
         seqno = envelope.msg.get('seqno')
-        self.log['commit'][seqno].add(envelope.origin.address)
-        # committed-local is true if and only if prepared is true and has accepted 2f+1 commits
-        # (possibly including its own)
-        if self.log['prepared'][seqno] and len(self.log['commit'][seqno]) >= 2 * self.network.f + 1:
-            self.log['committed'][seqno] = True
+        if self.log['commit'].entry(seqno).add(envelope.msg['replica_id']):
+            self._check_committed(seqno)
+
+    def _check_committed(self, seqno):
+        """committed-local is true if and only if prepared is true and has accepted 2f+1 commits
+        (possibly including its own)"""
+        if not self.log['prepared'][seqno] or len(self.log['commit'][seqno]) < 2 * self.network.f + 1:
+            return
+        if self.vote_mode == 'collector' and not self._certify(seqno, 'commit'):
+            return
+        self._commit(seqno)
+
+    def _commit(self, seqno):
+        """committed-local becomes true: the block is executed once"""
         if self.log['committed'][seqno]:
-            # TODO: sometimes, committed block is not in the log, i.e., not received from pre-prepare yet...
-            #  It feels weird that commit comes earlier than pre-prepare...
-            # Note from Ryan - Is this just at the end of the sim? If so, this could make sense...
-            if self.log['block'][seqno]:
-                new_block = self.log['block'][seqno]
-                # if self._is_primary():
-                client_reply = self.network_message.client_reply(new_block)
-                self.env.process(self.broadcast_to_non_authorities(client_reply))
-                self.chain.add_block(new_block)
-                if self.verbose:
-                    print(
-                        f'{self.address} at {time(self.env)}: Block assembled and added to the tip of the chain  {new_block.header}')
+            return
+        self.log['committed'][seqno] = True
+        # TODO: sometimes, committed block is not in the log, i.e., not received from pre-prepare yet...
+        #  It feels weird that commit comes earlier than pre-prepare...
+        # Note from Ryan - Is this just at the end of the sim? If so, this could make sense...
+        # The slot of the block is kept even if the pre-prepare did not arrive yet, which
+        # tells `_check_timeout` that the sequence number made progress
+        new_block = self.log['block'].entry(seqno)
+        if new_block:
+            self._execute_block(new_block)
+
+    ##                                               ##
+    ##        Vote aggregation (collector mode)      ##
+    ##                                               ##
+
+    def _certify(self, seqno, phase):
+        """Multicasts the certificate of the votes of a `phase` as their collector, if not done
+        yet for `seqno`. Returns `True` if the certificate is sent"""
+        certified = self.log['certified'].entry(seqno)
+        if phase in certified:
+            return False
+        certified.add(phase)
+        certificate = self.network_message.certificate(phase, seqno, self.log[phase][seqno])
+        self.env.process(self.broadcast_to_authorities(certificate))
+        return True
+
+    def _send_vote(self, destination_address, msg):
+        """Sends a vote to its collector only, like the votes broadcast to the authorities"""
+        session = self.active_sessions.get(destination_address)
+        if session is None:
+            return
+        yield from self.network.multicast(msg, [session['connection']], self._monitor_propagation(msg))
+
+    def _receive_prepare_certificate(self, envelope):
+        """Handle a prepare certificate: prepared becomes true, and the commit vote goes back to
+        the collector"""
+        if not self.validate_message_digest(envelope.msg):
+            return
+        seqno = envelope.msg.get('seqno')
+        self._prepared(seqno)
+        commit_msg = self.network_message.commit(seqno)
+        self.env.process(self._send_vote(envelope.origin.address, commit_msg))
+
+    def _receive_commit_certificate(self, envelope):
+        """Handle a commit certificate: committed-local becomes true"""
+        if not self.validate_message_digest(envelope.msg):
+            return
+        self._commit(envelope.msg.get('seqno'))
+
+    def _execute_block(self, new_block):
+        """Adds a committed block to the chain and replies to the other nodes"""
+        # if self._is_primary():
+        client_reply = self.network_message.client_reply(new_block)
+        self.env.process(self.broadcast_to_non_authorities(client_reply))
+        self.chain.add_block(new_block)
+        self.network.block_executed(new_block, self)
+        if self.verbose:
+            print(
+                f'{self.address} at {time(self.env)}: Block assembled and added to the tip of the chain  {new_block.header}')
 
     # How non-authority nodes handle the receipt of a reply message from an authority
     def _receive_reply(self, envelope):
@@ -367,28 +468,47 @@ class PBFTNode(Node):
             raise RuntimeError(f'Node {self.location} is an authority - they should not receive replies')
 
         new_block = envelope.msg.get('result')
-        timestamp = envelope.msg.get('timestamp')
+        number = new_block.header.number
 
-        self.log['reply'][timestamp].add(envelope.origin.address)
-        if len(self.log['reply'][timestamp]) >= (2 * self.network.f + 1):
+        # Replies are counted per block, as two blocks can have the same number
+        replies = self.log['reply'].entry(number).setdefault(new_block.header.hash, Votes())
+        if replies.add(envelope.msg['replica_id']) and len(replies) == 2 * self.network.f + 1:
             self.chain.add_block(new_block)
+            if new_block.transactions is not None:
+                self.env.tx_lifecycle.mark('replied', new_block.transactions, self.env.now)
+            self.log['reply'].truncate(self._reply_watermark())
+
+    def _reply_watermark(self):
+        """Lowest block number whose replies are still needed: the head, where a competing
+        block can still be accepted, or the parent of a block waiting for it. It stays within
+        half of the log window below the head, so a parent that never gets its replies does
+        not stop the log"""
+        low = self.chain.head.header.number
+        for blocks in self.chain.parent_queue.values():
+            for block in blocks:
+                low = min(low, block.header.number - 1)
+        return max(low, self.chain.head.header.number - self.log.window // 2)
 
     ##                                               ##
     ##         View Changes and Checkpoints          ##
     ##                                               ##
 
-    def _check_timeout(self):
-        self.prevView = 0
-        self.timeoutCount = 0
-        self.prevLogBlockLength = 0
+    def _check_timeout(self, resume_at=None):
+        """`resume_at` is the time of the next check when resumed from a checkpoint"""
+        if resume_at is None:
+            self.prevView = 0
+            self.timeoutCount = 0
+            self.prevLogBlockLength = 0
+            yield self.env.timeout(self.timeoutVal)
+        else:
+            yield timeout_at(self.env, resume_at)
 
         while True:
-            yield self.env.timeout(self.timeoutVal)
             # TOT: Bugfix. prevLog always same as log
             # assert self.prevLogBlockLength == len(self.log['block'])
             # TODO: Bugfix. Stop timeout and viewchange sending after leader change! Jiali
-            if self.prevView == self.network.view and (self.prevLogBlockLength == len(
-                    self.log['block'])):  # No new blocks have been sent to a node + prevLog nonempty
+            if self.prevView == self.network.view and (self.prevLogBlockLength == self.log[
+                    'block'].added):  # No new blocks have been sent to a node + prevLog nonempty
                 self.timedout = True
                 self._send_viewchange()
                 self.timeoutCount += 1
@@ -396,46 +516,47 @@ class PBFTNode(Node):
                 self.timeoutCount = 0
 
             self.prevView = self.network.view
-            self.prevLogBlockLength = len(self.log['block'])  # track log every timeout check
+            self.prevLogBlockLength = self.log['block'].added  # track log every timeout check
+            yield self.env.timeout(self.timeoutVal)
 
-    def _checkpointing(self):
+    def _checkpointing(self, resume_at=None):
+        """`resume_at` is the time of the next check when resumed from a checkpoint"""
+        if resume_at is not None:
+            yield timeout_at(self.env, resume_at)
         while True:
-            if (
-                    self.currSeqno % self.network.checkpoint_size) == 0:  # and (self.currSeqno - self.lastCheckpoint == self.network.checkpoint_size):  # Periodically see if we have reached a checkpoint handler
-                self._send_checkpoint_message(self.currSeqno)
+            # The state of a replica is its chain, up to its head
+            executed = self.chain.head.header.number
+            if (executed % self.network.checkpoint_size) == 0:  # Periodically see if we have reached a checkpoint handler
+                self._send_checkpoint_message(executed)
             yield self.env.timeout(self.network.checkpoint_delay)
 
     def _send_checkpoint_message(self, seqno):
         checkpoint_msg = self.network_message.checkpoint(seqno, self.replica_id)
         self.env.process(self.broadcast_to_authorities(checkpoint_msg))
-        self.log['checkpoint'][seqno].add(self.address)
+        self.log['checkpoint'].add(self.replica_id, seqno)
 
     def _receive_checkpoint_message(self, envelope):
         # yield self.env.timeout(self.network.validation_delay)
         if not self.validate_message_digest(envelope.msg):
             return
-        seqno = envelope.msg.get('seqno')
-        self.log['checkpoint'][seqno].add(envelope.origin.address)
+        self.log['checkpoint'].add(envelope.msg.get('replica_id'), envelope.msg.get('seqno'))
 
-        if self.log['checkpoint'][seqno] and len(self.log['checkpoint'][seqno]) >= 2 * self.network.f:
+        # A checkpoint is stable when 2f replicas announced it or a later one
+        stable = self.log['checkpoint'].stable(2 * self.network.f)
+        if stable is not None and stable > self.lastCheckpoint:
             # Clear out log entries covered by a checkpoint state
-            if self.log['committed'][self.lastCheckpoint]:
-                for oldSeqno in range(self.lastCheckpoint, seqno):
-                    # TODO: Iron out what to do with reply messages since they use timestamp instead of seqno
-                    del self.log['reply'][self.log['block'][oldSeqno].header.timestamp]
-                    del self.log['block'][oldSeqno]
-                    del self.log['prepare'][oldSeqno]
-                    del self.log['prepared'][oldSeqno]
-                    del self.log['commit'][oldSeqno]
-                    del self.log['committed'][oldSeqno]
-                self.lastCheckpoint = seqno
+            self.log.truncate(stable)
+            self.preparemsg.truncate(stable)
+            # Blocks a window behind the checkpoint are no longer executed by the authorities that are up to date
+            self.network.truncate_votes(stable - self.log.window)
+            self.lastCheckpoint = stable
 
     # IMPORTANT NOTE: View changes cannot be correctly implemented until checkpoints are first!
     def _send_viewchange(self):
-        checkpoint_msg = self.log['checkpoint'][self.lastCheckpoint]
+        checkpoint_msg = self.log['checkpoint'].voters(self.lastCheckpoint)
         prepare_msg = self._collect_viewchange_prepareset()
         viewchange_msg = self.network_message.view_change(self.lastCheckpoint, checkpoint_msg, prepare_msg)
-        self.log['viewchange'][self.network.view].append((self.address, viewchange_msg))
+        self.log['viewchange'].entry(self.network.view).append((self.address, viewchange_msg))
         self.env.process(self.broadcast_to_authorities(viewchange_msg))
 
     def _collect_viewchange_prepareset(self):
@@ -455,14 +576,16 @@ class PBFTNode(Node):
         newView = envelope.msg.get('nextview')
         if newView <= self.network.view:
             return
-        for (address, msg) in self.log['viewchange'][
-            newView]:  # Deal with list duplicates for viewchanges (need actual contents of viewchange messages, so can't use set)
+        # The view changes and new views of the previous views are not needed anymore
+        self.log.truncate_views(self.network.view)
+        viewchanges = self.log['viewchange'].entry(newView)
+        for (address, msg) in viewchanges:  # Deal with list duplicates for viewchanges (need actual contents of viewchange messages, so can't use set)
             if address == envelope.origin.address:
-                self.log['viewchange'][newView].remove((address, msg))
-                self.log['viewchange'][newView].append((envelope.origin.address, envelope.msg))
+                viewchanges.remove((address, msg))
+                viewchanges.append((envelope.origin.address, envelope.msg))
                 break
         else:
-            self.log['viewchange'][newView].append((envelope.origin.address, envelope.msg))
+            viewchanges.append((envelope.origin.address, envelope.msg))
 
         if self._is_next_primary():
             if len(self.log['viewchange'][newView]) >= (2 * self.network.f + 1):
@@ -472,7 +595,7 @@ class PBFTNode(Node):
         viewchange_msg = self.log['viewchange'][self.network.view + 1]
         preprepare_msg = self._collect_newview_preprepareset(viewchange_msg)
         newview_msg = self.network_message.new_view(viewchange_msg, preprepare_msg)
-        self.log['newview'][newView].add(self.address)
+        self.log['newview'].entry(newView).add(self.address)
         self.env.process(self.broadcast_to_authorities(newview_msg))
         self.network.view += self.timeoutCount
 
@@ -508,7 +631,7 @@ class PBFTNode(Node):
         # New preprepare messages created for uncommitted messages from old view
         new_prepreparemsg = None
         for seqno in range(min_s, max_s + 1):
-            if seqno in existing_seqnos:
+            if seqno in existing_seqnos and seqno in self.preparemsg:
                 new_blocks = self.preparemsg[seqno].get('new_blocks')
                 block_bodies = self.preparemsg[seqno].get('block_bodies')
                 new_prepreparemsg = self.network_message.pre_prepare(seqno, new_blocks, block_bodies, True)
@@ -548,26 +671,3 @@ class PBFTNode(Node):
             return message["digest"]
         except KeyError:
             return "This message has no digest"
-
-    ##              ##
-    ## Chains       ##
-    ##              ##
-
-    def save_chains(self, day):
-        date = str(day)
-        file = Path.cwd() / 'blocksim' / 'chains' / (date + self.address)
-        with open(file, 'wb') as f:
-            pickle.dump((self.chain.head, self.chain.db), f)
-
-    def restore_chains(self, day):
-        date = str(day)
-        file = Path.cwd() / 'blocksim' / 'chains' / (date + self.address)
-        with open(file, 'rb') as f:
-            # yesterday_chains = pickle.load(f)
-            # genesis = yesterday_chains.genesis
-            # db = yesterday_chains.db
-            genesis, db = pickle.load(f)
-            consensus = Consensus(self.env)
-            self.chain = Chain(self.env, self, consensus, genesis, db)
-        # Jiali: remove dumped file after restore to collect garbage
-        file.unlink()
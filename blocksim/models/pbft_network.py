@@ -1,10 +1,11 @@
 import simpy
 from datetime import datetime
 from simpy import Store
-from blocksim.utils import get_random_values, time, get_latency_delay
+from blocksim.utils import get_random_values, time, get_latency_delay, timeout_at
 from random import random
 from enum import Enum
 from blocksim.models.permissioned_network import PermissionedNetwork
+import numpy as np
 
 
 # Ryan: Use this enum to be able to extensively configure different types of 'maliciousness'
@@ -24,19 +25,39 @@ class PBFTNetwork(PermissionedNetwork):
         self.checkpoint_size = 1 #How many blocks before you take a checkpoint, assuming seqno is per block
         self.checkpoint_delay = 10
         self.validation_delay = 0.1
-
-    def start_pbft_heartbeat(self):
-        self._init_lists()
+        # Number, and number of authorities that prepared, executed, and executed while honest
+        # each block not executed by all the authorities yet
+        self._block_votes = {}
+        # Blocks below this number are no longer counted
+        self._votes_low = 0
+        # Authorities that are not malicious, see `count_honest_authorities`
+        self.honest_authorities = 0
+        # Commit latency of each sequence number: from its pre-prepare to its execution by a quorum
+        self.commit_latencies = []
+        # Transactions in the blocks executed by a quorum
+        self.committed_transactions = 0
+        # `TimeSeriesSampler` of the network, when the `time_series` config entry is set
+        self.sampler = None
+
+    def start_pbft_heartbeat(self, resume_at=None):
+        """`resume_at` is the time of the next block when resumed from a checkpoint"""
+        if resume_at is None:
+            self._init_lists()
+
+            # (Ryan) Initialize max # of faulty nodes after lists have been initialized
+            # Casting the divison result to an int is equivalent to applying floor function
+            self.f = int(len(self._list_authority_nodes)/3)
+            self.count_honest_authorities()
         empty_block = 0
 
-        # (Ryan) Initialize max # of faulty nodes after lists have been initialized
-        # Casting the divison result to an int is equivalent to applying floor function
-        self.f = int(len(self._list_authority_nodes)/3)
-        
         while True:
-            time_between_blocks = round(get_random_values(
-                self.env.delays['time_between_blocks_seconds'])[0], 2)
-            yield self.env.timeout(time_between_blocks)
+            if resume_at is None:
+                time_between_blocks = round(get_random_values(
+                    self.env.delays['time_between_blocks_seconds'])[0], 2)
+                yield self.env.timeout(time_between_blocks)
+            else:
+                yield timeout_at(self.env, resume_at)
+                resume_at = None
 
             # Ryan: Implement new block selection process here (updated for PBFT 7/3!)
             # Bugfix: IndexError: list index out of range, bugfix done
@@ -56,6 +77,83 @@ class PBFTNetwork(PermissionedNetwork):
 
             self.env.data['end_simulation_time'] = datetime.utcfromtimestamp(self.env.now).strftime('%m-%d %H:%M:%S')
 
+    def count_honest_authorities(self):
+        """Counts the authorities that are not malicious, when the nodes are built and when a
+        checkpoint is restored: the nodes keep the `is_malicious` of their config when a
+        what-if branch restores a checkpoint"""
+        self.honest_authorities = sum(
+            1 for node in self._list_authority_nodes if node.is_malicious == MaliciousModel.NOT_MALICIOUS)
+
+    def _votes(self, block):
+        """[number, preparations, executions, honest executions] of `block`, or None when it
+        is below the blocks counted"""
+        number = block.header.number
+        if number < self._votes_low:
+            return None
+        votes = self._block_votes.get(block.header.hash)
+        if votes is None:
+            votes = self._block_votes[block.header.hash] = [number, 0, 0, 0]
+        return votes
+
+    def block_prepared(self, block):
+        """Called when an authority prepares a `block`. When 2f+1 authorities did, its
+        transactions are prepared (see `TransactionLifecycle`)"""
+        votes = self._votes(block)
+        if votes is None:
+            return
+        votes[1] += 1
+        if votes[1] == 2 * self.f + 1 and block.transactions is not None:
+            self.env.tx_lifecycle.mark('prepared', block.transactions, self.env.now)
+
+    def block_executed(self, block, node):
+        """Called when an authority `node` executes a committed `block`. When 2f+1 authorities
+        did, the commit latency of its sequence number is recorded in the `commits` report table,
+        and when all the honest authorities did, its transactions are committed and the block
+        is no longer counted"""
+        votes = self._votes(block)
+        if votes is None:
+            return
+        votes[2] += 1
+        if votes[2] == 2 * self.f + 1:
+            latency = self.env.now - block.header.timestamp
+            self.commit_latencies.append(latency)
+            if block.transactions is not None:
+                self.committed_transactions += len(block.transactions)
+            self.env.report.event(
+                'commits', seqno=block.header.number, view=self.view, proposed_at=block.header.timestamp,
+                committed_at=self.env.now, latency=latency)
+        if node.is_malicious == MaliciousModel.NOT_MALICIOUS:
+            votes[3] += 1
+            # A what-if branch can have less honest authorities than the executions counted before it
+            if votes[3] >= self.honest_authorities and block.transactions is not None:
+                self.env.tx_lifecycle.mark('committed', block.transactions, self.env.now)
+        if votes[3] >= self.honest_authorities and votes[2] >= 2 * self.f + 1:
+            del self._block_votes[block.header.hash]
+
+    def truncate_votes(self, number):
+        """Stops counting the blocks below `number`, which were left by forks and view changes
+        or not executed by every honest authority"""
+        if number <= self._votes_low:
+            return
+        self._votes_low = number
+        for block_hash in [block_hash for block_hash, votes in self._block_votes.items() if votes[0] < number]:
+            del self._block_votes[block_hash]
+
+    def commit_latency_summary(self):
+        """Summary of the commit latencies of the sequence numbers committed so far"""
+        latencies = np.asarray(self.commit_latencies, dtype=float)
+        if len(latencies) == 0:
+            return {'count': 0}
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]).tolist()
+        return {
+            'count': len(latencies),
+            'mean': float(latencies.mean()),
+            'p50': p50,
+            'p95': p95,
+            'p99': p99,
+            'max': float(latencies.max())
+        }
+
     def start_poa_heartbeat(self):
         self._init_lists()
         empty_block = 0
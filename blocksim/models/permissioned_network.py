@@ -1,17 +1,50 @@
+import numpy as np
 from blocksim.models.network import Network, Connection
+from blocksim.models.node import Envelope
+from blocksim.utils import get_sent_delays, time
 
 
 class PermissionedNetwork(Network):
     def __init__(self, env, name):
         super().__init__(env, name)
         self._list_authority_nodes = []  # Want to keep track of which nodes are authorities
+        self.authority_addresses = set()  # Addresses of the authorities, to test membership
         self.authority_index = 0  # Keep track of which authority we're on
+        # Block policy shared by the authorities (see `network_block_policy`)
+        self.block_policy = None
 
     def add_node(self, node):
         self._nodes[node.address] = node
+        if node.is_authority:
+            self.authority_addresses.add(node.address)
 
     def _init_lists(self):
         for add, node in self._nodes.items():
             self._list_nodes.append(node)
             if node.is_authority:  # Put the authority nodes in the authority node list
                 self._list_authority_nodes.append(node)
+
+    def multicast(self, msg, connections: list, on_send=None):
+        """Sends `msg` through all `connections` of an origin node, as if the message was
+        uploaded to one destination after the other in the order of `connections`.
+
+        The upload delays of all destinations are drawn at once and every envelope is
+        scheduled with its own upload and latency delays (see `Connection.put`), without a
+        process per destination, so this process only waits for the end of the last upload. `on_send(connection, start)` is called for each destination
+        with the simulated time at which its upload starts."""
+        if not connections:
+            return
+        origin_node = connections[0].origin_node
+        destinations = [connection.destination_node.location_id for connection in connections]
+        upload_delays = get_sent_delays(
+            self.env, msg['size'], origin_node.location_id, destinations)
+        # Uploads are sequential: each one ends after the ones before it
+        upload_ends = np.cumsum(upload_delays)
+        now = self.env.now
+        for connection, upload_end, upload_delay in zip(connections, upload_ends.tolist(), upload_delays.tolist()):
+            if on_send is not None:
+                on_send(connection, now + upload_end - upload_delay)
+            envelope = Envelope(msg, time(self.env, now + upload_end),
+                                connection.destination_node, origin_node)
+            connection.put(envelope, upload_end)
+        yield self.env.timeout(upload_ends[-1])
@@ -4,6 +4,7 @@ from blocksim.models.permissioned_network import Connection, Network
 from blocksim.models.chain import Chain
 from blocksim.models.node import Node
 from blocksim.models.consensus import Consensus
+from blocksim.models.known_inventory import KnownTxFilter
 from blocksim.utils import get_received_delay, get_sent_delay, get_latency_delay, time
 
 Envelope = namedtuple('Envelope', 'msg, timestamp, destination, origin')
@@ -24,6 +25,8 @@ class PermNode(Node):
                  consensus: Consensus,
                  is_authority: bool):
 
+        #Indicate whether the permissioned node is an authority or not
+        self.is_authority = is_authority
         super().__init__(env, network, location, address, chain, consensus)
         # self.verbose = verbose
         # self.env = env
@@ -39,47 +42,41 @@ class PermNode(Node):
         # Set the monitor to count the forks during the simulation
         # key = f'forks_{address}'
         # self.env.data[key] = 0
-        
-        #Indicate whether the permissioned node is an authority or not
-        self.is_authority = is_authority
+
+    def _new_exact_known_txs(self):
+        # Permissioned transactions are IDs in the world transaction table
+        return KnownTxFilter(MAX_KNOWN_TXS)
+
+    def _estimate_exact_known_txs_nbytes(self, count, key):
+        return KnownTxFilter.estimate_nbytes(MAX_KNOWN_TXS, count)
 
     def listening_node(self, connection):
         while True:
             # Get the messages from connection
             envelope = yield connection.get()
-            origin_loc = envelope.origin.location
-            dest_loc = envelope.destination.location
+            origin_loc = envelope.origin.location_id
+            dest_loc = envelope.destination.location_id
             message_size = envelope.msg['size']
             received_delay = get_received_delay(
                 self.env, message_size, origin_loc, dest_loc)
             yield self.env.timeout(received_delay)
-
-            # Monitor the transaction propagation on Ethereum
-            if envelope.msg['id'] == 'transactions':
-                tx_propagation = self.env.data['tx_propagation'][
-                    f'{envelope.origin.address}_{envelope.destination.address}']
-                txs = {}
-                for tx in envelope.msg['transactions']:
-                    initial_time = tx_propagation.get(tx.hash[:8], None)
-                    if initial_time is not None:
-                        propagation_time = self.env.now - initial_time
-                        txs.update({f'{tx.hash[:8]}': propagation_time})
-                self.env.data['tx_propagation'][f'{envelope.origin.address}_{envelope.destination.address}'].update(
-                    txs)
-            # Monitor the block propagation on Ethereum and PBFT
-            if envelope.msg['id'] in ('block_bodies', 'pre-prepare'):
-                block_propagation = self.env.data['block_propagation'][
-                    f'{envelope.origin.address}_{envelope.destination.address}']
-                blocks = {}
-                for block_hash, _ in envelope.msg['block_bodies'].items():
-                    initial_time = block_propagation.get(block_hash[:8], None)
-                    if initial_time is not None:
-                        propagation_time = self.env.now - initial_time
-                        blocks.update({f'{block_hash[:8]}': propagation_time})
-                self.env.data['block_propagation'][f'{envelope.origin.address}_{envelope.destination.address}'].update(
-                    blocks)
-
-            self._read_envelope(envelope)
+            self._receive_envelope(envelope)
+
+    def _receive_envelope(self, envelope):
+        """Handles an envelope once it is fully received"""
+        self.network.messages_received += 1
+        origin = envelope.origin.node_index
+        destination = envelope.destination.node_index
+        # Monitor the transaction propagation on Ethereum
+        if envelope.msg['id'] == 'transactions':
+            self.env.propagation.received(
+                'tx', origin, destination, envelope.msg.get('propagation_key'), self.env.now)
+        # Monitor the block propagation on Ethereum and PBFT
+        if envelope.msg['id'] in ('block_bodies', 'pre-prepare'):
+            for block_hash in envelope.msg['block_bodies']:
+                self.env.propagation.received('block', origin, destination, block_hash, self.env.now)
+
+        self._read_envelope(envelope)
 
     def send(self, destination_address: str, msg):
         if self.address == destination_address:
@@ -111,7 +108,7 @@ class PermNode(Node):
             yield self.env.timeout(delay)
 
         upload_transmission_delay = get_sent_delay(
-            self.env, msg['size'], origin_node.location, destination_node.location)
+            self.env, msg['size'], origin_node.location_id, destination_node.location_id)
         yield self.env.timeout(upload_transmission_delay)
 
         envelope = Envelope(msg, time(self.env), destination_node, origin_node)
@@ -140,95 +137,42 @@ class PermNode(Node):
             yield self.env.timeout(delay)
 
         """Broadcast a message to all nodes with an active session"""
-        for add, node in self.active_sessions.items():
-            connection = node['connection']
-            origin_node = connection.origin_node
-            destination_node = connection.destination_node
+        connections = [node['connection'] for node in self.active_sessions.values()]
+        yield from self.network.multicast(msg, connections, self._monitor_propagation(msg))
 
+    def broadcast_to_authorities(self, msg):
+        """Broadcast a message to all authorities with an active session"""
+        connections = [
+            node['connection'] for address, node in self.active_sessions.items()
+            if address in self.network.authority_addresses]
+        yield from self.network.multicast(msg, connections, self._monitor_propagation(msg))
+
+    def broadcast_to_non_authorities(self, msg):
+        """Broadcast a message to all non authorities with an active session"""
+        connections = [
+            node['connection'] for address, node in self.active_sessions.items()
+            if address not in self.network.authority_addresses]
+
+        def on_send(connection, start):
+            # Monitor the transaction propagation on PBFT network
+            if msg['id'] == 'reply' and self.verbose:
+                print("Reply being sent to " + connection.destination_node.address)
+
+        yield from self.network.multicast(msg, connections, on_send)
+
+    def _monitor_propagation(self, msg):
+        """Returns the callback of `multicast` that marks the time at which the transactions
+        or blocks of `msg` start to be sent to each node"""
+        def on_send(connection, start):
+            origin = connection.origin_node.node_index
+            destination = connection.destination_node.node_index
             # Monitor the transaction propagation on Ethereum
             if msg['id'] == 'transactions':
-                txs = {}
-                for tx in msg['transactions']:
-                    txs.update({f'{tx.hash[:8]}': self.env.now})
-                self.env.data['tx_propagation'][f'{origin_node.address}_{destination_node.address}'].update(
-                    txs)
+                self.env.propagation.sent(
+                    'tx', origin, destination, self.env.propagation.message_key(msg), start,
+                    len(msg['transactions']))
             # Monitor the block propagation on Ethereum
             if msg['id'] in ('new_blocks', 'pre-prepare'):
-                blocks = {}
                 for block_hash in msg['new_blocks']:
-                    blocks.update({f'{block_hash[:8]}': self.env.now})
-                self.env.data['block_propagation'][f'{origin_node.address}_{destination_node.address}'].update(
-                    blocks)
-
-            upload_transmission_delay = get_sent_delay(
-                self.env, msg['size'], origin_node.location, destination_node.location)
-            yield self.env.timeout(upload_transmission_delay)
-            envelope = Envelope(msg, time(self.env),
-                                destination_node, origin_node)
-            connection.put(envelope)
-            
-    def broadcast_to_authorities(self, msg):
-        """Broadcast a message to all nodes with an active session"""
-        for add, node in self.active_sessions.items():
-            
-            #Want to test if the node is an authority
-            authority_addresses = []
-            for auth_node in self.network._list_authority_nodes:
-                authority_addresses.append(auth_node.address)
-                
-            if add in authority_addresses:
-            
-                connection = node['connection']
-                origin_node = connection.origin_node
-                destination_node = connection.destination_node
-
-                # Monitor the transaction propagation on Ethereum
-                if msg['id'] == 'transactions':
-                    txs = {}
-                    for tx in msg['transactions']:
-                        txs.update({f'{tx.hash[:8]}': self.env.now})
-                    self.env.data['tx_propagation'][f'{origin_node.address}_{destination_node.address}'].update(
-                    txs)
-                    
-                # Monitor the block propagation on Ethereum
-                if msg['id'] == 'new_blocks' or msg['id'] == 'pre-prepare':
-                    blocks = {}
-                    for block_hash in msg['new_blocks']:
-                        blocks.update({f'{block_hash[:8]}': self.env.now})
-                    self.env.data['block_propagation'][f'{origin_node.address}_{destination_node.address}'].update(
-                    blocks)
-
-                upload_transmission_delay = get_sent_delay(
-                    self.env, msg['size'], origin_node.location, destination_node.location)
-                yield self.env.timeout(upload_transmission_delay)
-                envelope = Envelope(msg, time(self.env),
-                                destination_node, origin_node)
-                connection.put(envelope)
-                
-    def broadcast_to_non_authorities(self, msg):
-        """Broadcast a message to all nodes with an active session"""
-        for add, node in self.active_sessions.items():
-            
-            #Want to test if the node is an authority
-            authority_addresses = []
-            for auth_node in self.network._list_authority_nodes:
-                authority_addresses.append(auth_node.address)
-                
-            if add not in authority_addresses:
-            
-                connection = node['connection']
-                origin_node = connection.origin_node
-                destination_node = connection.destination_node
-
-                # Monitor the transaction propagation on PBFT network
-                if msg['id'] == 'reply' and self.verbose:
-                    print("Reply being sent to " + add)
-
-                upload_transmission_delay = get_sent_delay(
-                    self.env, msg['size'], origin_node.location, destination_node.location)
-                yield self.env.timeout(upload_transmission_delay)
-                envelope = Envelope(msg, time(self.env),
-                                destination_node, origin_node)
-                connection.put(envelope)
-            
-
+                    self.env.propagation.sent('block', origin, destination, block_hash, start)
+        return on_send
@@ -1,40 +1,119 @@
-from collections import OrderedDict
-# from collections import deque
-# from blocksim.utils import time
+from collections import deque
+import numpy as np
+from blocksim.models.transaction_table import TX_ID_DTYPE
 
 
 class TransactionQueue():
+    """FIFO queue of the transaction IDs (see `TransactionTable`) waiting to be included in a block.
+
+    IDs are kept in a deque of NumPy chunks, in the order they arrive. A mask indexed by transaction
+    ID tells whether a transaction is queued, so duplicated transactions are ignored and removing
+    a transaction only clears its flag. The time each chunk was queued is kept along."""
+
     def __init__(self, env, node, consensus):
         self._env = env
         self._node = node
         self._consensus = consensus
-        self._transaction_queue = OrderedDict()
+        self._chunks = deque()
+        # Simulated time at which each chunk was queued
+        self._chunk_times = deque()
+        # Position of the next transaction in the first chunk
+        self._head = 0
+        self._queued = np.zeros(0, dtype=bool)
+        self._size = 0
         key = f'{node.address}_number_of_transactions_queue'
         self._env.data[key] = 0
 
+    def _fit(self, tx_id):
+        """Grows the queued mask to hold `tx_id`"""
+        if tx_id < len(self._queued):
+            return
+        grown = np.zeros(max(2 * len(self._queued), tx_id + 1), dtype=bool)
+        grown[:len(self._queued)] = self._queued
+        self._queued = grown
+
     def put(self, tx):
-        key = f'{self._node.address}_number_of_transactions_queue'
-        self._env.data[key] += 1
-        self._transaction_queue[tx.signature] = tx
+        self.add_txs(np.array([tx], dtype=TX_ID_DTYPE))
 
     def get(self):
         # TODO: A delay to retrieve a transaction from the Queue
-        # Jiali: FIFO popitem is achieved with the OrderedDict() here
-        return self._transaction_queue.popitem(last=False)[1]
+        return int(self.get_many(1)[0])
+
+    def get_many(self, n):
+        """Removes and returns the first `n` (or less if the queue gets empty) transaction IDs"""
+        return self.take(n)[0]
+
+    def take(self, n):
+        """Like `get_many`, but also returns an array with the time each transaction was queued"""
+        pending = []
+        queued_at = []
+        missing = n
+        while missing > 0 and self._chunks:
+            chunk = self._chunks[0]
+            chunk_time = self._chunk_times[0]
+            window = chunk[self._head:self._head + missing]
+            self._head += len(window)
+            if self._head >= len(chunk):
+                self._chunks.popleft()
+                self._chunk_times.popleft()
+                self._head = 0
+            # Skip the transactions that were removed meanwhile
+            window = window[self._queued[window]]
+            if len(window) > 1:
+                window, first = np.unique(window, return_index=True)
+                window = window[np.argsort(first)]
+            self._queued[window] = False
+            pending.append(window)
+            queued_at.append(np.full(len(window), chunk_time))
+            missing -= len(window)
+        self._size -= n - missing
+        if not pending:
+            return np.empty(0, dtype=TX_ID_DTYPE), np.empty(0)
+        return np.concatenate(pending), np.concatenate(queued_at)
 
     def remove(self, tx):
-        # None is the default value for pop, so no exception is raised if given key doesn't exist
-        return self._transaction_queue.pop(tx.signature, None)
+        # No exception is raised if given transaction is not queued
+        if tx < len(self._queued) and self._queued[tx]:
+            self._queued[tx] = False
+            self._size -= 1
+            return tx
+        return None
 
     def remove_txs(self, txs):
-        [self._transaction_queue.pop(tx.signature) for tx in txs]
+        txs = np.asarray(txs, dtype=TX_ID_DTYPE)
+        txs = txs[txs < len(self._queued)]
+        txs = np.unique(txs[self._queued[txs]])
+        self._queued[txs] = False
+        self._size -= len(txs)
 
     def add_txs(self, txs):
-        for tx in txs:
-            self.put(tx)
+        txs = np.asarray(txs, dtype=TX_ID_DTYPE)
+        if len(txs) == 0:
+            return
+        key = f'{self._node.address}_number_of_transactions_queue'
+        self._env.data[key] += len(txs)
+        self._fit(txs.max())
+        new_txs = txs[~self._queued[txs]]
+        if len(new_txs) > 1:
+            new_txs, first = np.unique(new_txs, return_index=True)
+            new_txs = new_txs[np.argsort(first)]
+        self._queued[new_txs] = True
+        self._chunks.append(new_txs)
+        self._chunk_times.append(self._env.now)
+        self._size += len(new_txs)
+
+    def pending(self):
+        """Returns the IDs of the queued transactions in their order, without removing them"""
+        if not self._chunks:
+            return np.empty(0, dtype=TX_ID_DTYPE)
+        chunks = list(self._chunks)
+        txs = np.concatenate([chunks[0][self._head:]] + chunks[1:])
+        txs = txs[self._queued[txs]]
+        txs, first = np.unique(txs, return_index=True)
+        return txs[np.argsort(first)]
 
     def is_empty(self):
-        return len(self._transaction_queue) == 0
+        return self._size == 0
 
     def size(self):
-        return len(self._transaction_queue)
+        return self._size
@@ -1,12 +1,15 @@
+import numpy as np
 from blocksim.models.permissioned_node import PermNode as Node
 from blocksim.models.permissioned_network import Network
 from blocksim.models.chain import Chain
 from blocksim.models.consensus import Consensus
-from blocksim.models.db import BaseDB
+from blocksim.models.chain_index import ChainIndex
 from blocksim.models.permissoned_transaction_queue import TransactionQueue
-from blocksim.utils import time, get_random_values
+from blocksim.models.transaction_table import TX_ID_DTYPE
+from blocksim.utils import time
 from blocksim.models.block import Block, BlockHeader
 from blocksim.models.poa.message import Message
+from blocksim.models.block_policy import network_block_policy
 
 
 class POANode(Node):
@@ -22,7 +25,7 @@ class POANode(Node):
         # Create the PoA genesis block and init the chain
         genesis = Block(BlockHeader())
         consensus = Consensus(env)
-        chain = Chain(env, self, consensus, genesis, BaseDB())
+        chain = Chain(env, self, consensus, genesis, ChainIndex(env.blocks))
         self.is_authority = is_authority
         super().__init__(env,
                          network,
@@ -37,6 +40,8 @@ class POANode(Node):
             # Transaction Queue to store the transactions
             self.transaction_queue = TransactionQueue(
                 env, self, self.consensus)
+            # Number of transactions of the queue put in each block
+            self.block_policy = network_block_policy(self.network, self.env.config['poa'])
         self._handshaking = env.event()
 
     def build_new_block(self):
@@ -45,24 +50,12 @@ class POANode(Node):
         Jiali: This function is borrowed from bitcoin/node.py, without too much change."""
         if self.is_authority is False:
             raise RuntimeError(f'Node {self.location} is not a authority')
-        block_size = self.env.config['poa']['block_size_limit_mb']
-        transactions_per_block_dist = self.env.config[
-            'poa']['number_transactions_per_block']
-        transactions_per_block = int(
-            get_random_values(transactions_per_block_dist)[0])
-        pending_txs = []
-        tx_left = True
-        for i in range(transactions_per_block * block_size):
-            if self.transaction_queue.is_empty():
-                if self.verbose:
-                    print(
-                        f'{self.address} at {time(self.env)}: No more transactions queued.')
-                # Jiali: stop simulation when tx are done, in order to know whether/when it happens
-                if i == 0:
-                    tx_left = False
-                break
-            pending_tx = self.transaction_queue.get()
-            pending_txs.append(pending_tx)
+        pending_txs = self.transaction_queue.get_many(self.block_policy.block_size_for(self))
+        # Jiali: stop simulation when tx are done, in order to know whether/when it happens
+        tx_left = len(pending_txs) > 0
+        if self.transaction_queue.is_empty() and self.verbose:
+            print(
+                f'{self.address} at {time(self.env)}: No more transactions queued.')
         candidate_block = self._build_candidate_block(pending_txs)
         if self.verbose:
             print(
@@ -145,21 +138,19 @@ class POANode(Node):
         as known by each node"""
         yield self.connecting  # Wait for all connections
         # yield self._handshaking  # Wait for handshaking to be completed
-        for node_address, node in self.active_sessions.items():
-            for tx in transactions:
-                # Checks if the transaction was previous sent
-                if any({tx.hash} & node.get('knownTxs')):
-                    if self.verbose:
-                        print(
-                            f'{self.address} at {time(self.env)}: Transaction {tx.hash[:8]} was already sent to {node_address}')
-                    transactions.remove(tx)
-                else:
-                    self._mark_transaction(tx.hash, node_address)
+        # Transactions are IDs in the world transaction table
+        transactions = np.asarray(transactions, dtype=TX_ID_DTYPE)
+        # Checks if the transactions were previously sent
+        unknown = self._unknown_transactions(transactions)
+        if self.verbose and not unknown.all():
+            print(
+                f'{self.address} at {time(self.env)}: {len(transactions) - unknown.sum()} transactions were already sent')
+        transactions = transactions[unknown]
         # Only send if it has transactions
-        if transactions:
+        if len(transactions) > 0:
             if self.verbose:
                 print(
-                    f'{self.address} at {time(self.env)}: {len(transactions)} transactions ready to be sent')
+                    f'{self.address} at {time(self.env)}: {len(transactions)} transactions ready to be sent')
             transactions_msg = self.network_message.transactions(transactions)
             # Jiali: I think node should also add tx to their own queue before they broadcast the txs
             if self.is_authority:
@@ -169,12 +160,8 @@ class POANode(Node):
     def _receive_full_transactions(self, envelope):
         """Handle full tx received. If node is authority store transactions in a pool (ordered by the gas price)"""
         transactions = envelope.msg.get('transactions')
-        valid_transactions = []
-        for tx in transactions:
-            if self.is_authority:
-                self.transaction_queue.put(tx)
-            else:
-                valid_transactions.append(tx)
+        if self.is_authority:
+            self.transaction_queue.add_txs(transactions)
         # self.env.process(self.broadcast_transactions(valid_transactions))
 
     ##              ##
@@ -0,0 +1,132 @@
+import numpy as np
+
+# Kinds of propagation monitored
+KINDS = ('tx', 'block')
+# Edges of the log-spaced histogram bins of the propagation times (seconds), about 1% wide
+HISTOGRAM_EDGES = np.logspace(-6, 6, 2781)
+PERCENTILES = (50, 90, 99)
+# Simulated seconds after which a propagation that was never received (e.g. its message was
+# dropped) is expired
+PENDING_EXPIRY = 600
+
+
+class PropagationMetrics:
+    """Records the propagation times of transactions and blocks between pairs of nodes.
+
+    A propagation starts when a node starts to send the transactions or blocks to a peer
+    (`sent`) and ends when the peer receives them (`received`). Only the propagations in
+    flight are kept; finished ones are added to fixed size arrays: a count, sum and maximum
+    per pair of nodes (indexed by `add_node`) and a log-spaced histogram per kind, from
+    which percentiles are computed. So memory and report size do not grow with the number
+    of transactions simulated.
+
+    Propagations of transactions are keyed by a sequence number stored in their message
+    (`message_key`), and the ones still in flight `expire_after` seconds after they started
+    are dropped and counted as `expired`, so lost messages do not pile up.
+
+    Every finished propagation is also streamed to the `propagation_events` table of the
+    `report`, when that group is selected.
+    """
+
+    def __init__(self, report=None, capacity=16, expire_after=PENDING_EXPIRY):
+        self._report = report
+        self._index = {}
+        self._pending = {kind: {} for kind in KINDS}
+        self.expire_after = expire_after
+        self._expired = {kind: 0 for kind in KINDS}
+        # Start time from which the propagations in flight are checked for expiry
+        self._next_expiry = expire_after
+        # Sequence number of the next message
+        self._sequence = 0
+        self._counts = {kind: np.zeros((capacity, capacity), dtype=np.int64) for kind in KINDS}
+        self._sums = {kind: np.zeros((capacity, capacity)) for kind in KINDS}
+        self._maxs = {kind: np.zeros((capacity, capacity)) for kind in KINDS}
+        self._histograms = {kind: np.zeros(len(HISTOGRAM_EDGES) + 1, dtype=np.int64) for kind in KINDS}
+
+    def add_node(self, address: str):
+        """Registers a node and returns its index in the pair arrays"""
+        index = self._index.setdefault(address, len(self._index))
+        capacity = len(self._counts[KINDS[0]])
+        if index >= capacity:
+            for arrays in (self._counts, self._sums, self._maxs):
+                for kind, array in arrays.items():
+                    grown = np.zeros((2 * capacity, 2 * capacity), dtype=array.dtype)
+                    grown[:capacity, :capacity] = array
+                    arrays[kind] = grown
+        return index
+
+    def message_key(self, msg: dict):
+        """Returns the key of the propagation of a message: a sequence number, stored in the
+        message (`propagation_key`) when it is first sent, so the key is unique and survives
+        checkpoints"""
+        key = msg.get('propagation_key')
+        if key is None:
+            key = msg['propagation_key'] = self._sequence
+            self._sequence += 1
+        return key
+
+    def sent(self, kind: str, origin: int, destination: int, key, start: float, count=1):
+        """Starts the propagation of `count` items identified by `key` from `origin` to
+        `destination` (node indexes) at the simulated time `start`"""
+        self._pending[kind][(origin, destination, key)] = (start, count)
+        if start >= self._next_expiry:
+            self._expire(start)
+
+    def _expire(self, now: float):
+        """Drops the propagations in flight that started `expire_after` seconds before `now`"""
+        oldest = now - self.expire_after
+        for kind, pending in self._pending.items():
+            expired = [key for key, (start, _) in pending.items() if start < oldest]
+            for key in expired:
+                del pending[key]
+            self._expired[kind] += len(expired)
+        self._next_expiry = now + self.expire_after
+
+    def received(self, kind: str, origin: int, destination: int, key, now: float):
+        """Ends a propagation started with `sent` (ignored if there is none)"""
+        pending = self._pending[kind].pop((origin, destination, key), None)
+        if pending is None:
+            return
+        start, count = pending
+        propagation_time = now - start
+        self._counts[kind][origin, destination] += count
+        self._sums[kind][origin, destination] += propagation_time * count
+        if propagation_time > self._maxs[kind][origin, destination]:
+            self._maxs[kind][origin, destination] = propagation_time
+        self._histograms[kind][np.searchsorted(HISTOGRAM_EDGES, propagation_time)] += count
+        if self._report is not None:
+            self._report.event(
+                'propagation_events', kind=kind, origin=origin, destination=destination,
+                start=start, end=now, count=count)
+
+    def percentile(self, kind: str, q: float):
+        """Returns the `q` percentile of the propagation times (within the histogram resolution)"""
+        histogram = self._histograms[kind]
+        total = histogram.sum()
+        if total == 0:
+            return None
+        position = np.searchsorted(np.cumsum(histogram), total * q / 100)
+        position = min(position, len(HISTOGRAM_EDGES) - 1)
+        return float(HISTOGRAM_EDGES[position])
+
+    def summary(self, kind: str):
+        """Returns the report of a kind of propagation: the overall count, mean, maximum and
+        percentiles, and the count and mean of each pair of nodes as matrices ordered by
+        the `nodes` list"""
+        n = len(self._index)
+        counts = self._counts[kind][:n, :n]
+        sums = self._sums[kind][:n, :n]
+        total = int(counts.sum())
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.where(counts > 0, sums / counts, np.nan)
+        return {
+            'count': total,
+            'mean': float(sums.sum() / total) if total else None,
+            'max': float(self._maxs[kind][:n, :n].max()) if total else None,
+            'percentiles': {f'p{q}': self.percentile(kind, q) for q in PERCENTILES},
+            'in_flight': len(self._pending[kind]),
+            'expired': self._expired[kind],
+            'nodes': list(self._index),
+            'pair_count': counts.tolist(),
+            'pair_mean': [[None if np.isnan(mean) else round(float(mean), 6) for mean in row] for row in means]
+        }
@@ -0,0 +1,78 @@
+import numpy as np
+from blocksim.utils import timeout_at
+
+
+class TimeSeriesSampler:
+    """Samples the state of a permissioned network every `interval` simulated seconds, from
+    now to `end`, to see saturation points and view change stalls inside a run.
+
+    Each sample has the number of transactions committed so far (in blocks executed by 2f+1
+    authorities), the number of messages in flight (sent and not received yet), the view, and
+    the size of the transaction queue of each authority. Samples are written into arrays
+    allocated at once for the whole run, so a sample only costs a few array writes.
+    """
+
+    def __init__(self, env, network, interval: float, end: float):
+        self.env = env
+        self.network = network
+        self.interval = interval
+        self.authorities = [node for node in network._nodes.values() if node.is_authority]
+        n = int((end - env.now) // interval) + 1
+        self.size = 0
+        self.time = np.zeros(n)
+        self.committed = np.zeros(n, dtype=np.int64)
+        self.in_flight = np.zeros(n, dtype=np.int64)
+        self.view = np.zeros(n, dtype=np.int32)
+        self.queues = np.zeros((n, len(self.authorities)), dtype=np.int32)
+
+    def run(self, resume_at=None):
+        """Sampling process. `resume_at` is the time of the next sample when resumed from a checkpoint"""
+        if resume_at is not None:
+            yield timeout_at(self.env, resume_at)
+        while True:
+            self.sample()
+            if self.size == len(self.time):
+                return
+            yield self.env.timeout(self.interval)
+
+    def sample(self):
+        i = self.size
+        network = self.network
+        self.time[i] = self.env.now
+        self.committed[i] = getattr(network, 'committed_transactions', 0)
+        self.in_flight[i] = network.messages_sent - network.messages_received
+        self.view[i] = getattr(network, 'view', 0)
+        self.queues[i] = [node.transaction_queue.size() for node in self.authorities]
+        self.size = i + 1
+
+    def tx_rate(self):
+        """Committed transactions per second between each sample and the one before it"""
+        committed = self.committed[:self.size]
+        rate = np.zeros(len(committed))
+        rate[1:] = np.diff(committed) / np.diff(self.time[:self.size])
+        return rate
+
+    def report(self, report):
+        """Writes the samples to the `time_series` table of the `report`, with a column per
+        authority queue"""
+        n = self.size
+        report.rows(
+            'time_series', time=self.time[:n], committed_transactions=self.committed[:n],
+            tx_rate=self.tx_rate(), in_flight_messages=self.in_flight[:n], view=self.view[:n],
+            **{f'queue_{node.address}': self.queues[:n, j] for j, node in enumerate(self.authorities)})
+
+    def summary(self):
+        """Peaks of the time series, for the JSON report"""
+        n = self.size
+        if n == 0:
+            return {'interval': self.interval, 'samples': 0}
+        rate = self.tx_rate()
+        return {
+            'interval': self.interval,
+            'samples': n,
+            'peak_tx_rate': float(rate.max()),
+            'peak_tx_rate_time': float(self.time[rate.argmax()]),
+            'peak_in_flight_messages': int(self.in_flight[:n].max()),
+            'peak_queue': int(self.queues[:n].max()) if self.authorities else 0,
+            'views': int(self.view[n - 1] - self.view[0])
+        }
@@ -12,8 +12,12 @@ class Transaction:
     :param value: amount to send to destination
     :param signature: sender signature
     :param fee: a fee destinated to the node that will insert the transaction on the chain
+
+    Transactions are immutable, so the hash is computed once on first access and cached.
     """
 
+    __slots__ = ('to', 'sender', 'value', 'signature', 'fee', '_hash')
+
     def __init__(self,
                  to,
                  sender,
@@ -26,10 +30,20 @@ class Transaction:
         self.signature = signature
         self.fee = fee
 
+    def __setattr__(self, name, value):
+        if hasattr(self, name):
+            raise AttributeError(f'{self.__class__.__name__} is immutable, {name} can not be changed')
+        super().__setattr__(name, value)
+
     @property
     def hash(self):
         """The transaction hash using Keccak 256"""
-        return encode_hex(keccak_256(str(self).encode('utf-8')))
+        try:
+            return self._hash
+        except AttributeError:
+            tx_hash = encode_hex(keccak_256(str(self).encode('utf-8')))
+            object.__setattr__(self, '_hash', tx_hash)
+            return tx_hash
 
     def __repr__(self):
         """Returns a unambiguous representation of the transaction"""
@@ -46,6 +60,9 @@ class Transaction:
     def __ne__(self, other):
         return not self.__eq__(other)
 
+    def __hash__(self):
+        return hash(self.hash)
+
     def __lt__(self, other):
         return isinstance(other, self.__class__) and self.fee < other.fee
 
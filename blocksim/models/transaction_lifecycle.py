@@ -0,0 +1,93 @@
+import numpy as np
+
+# Percentiles of the latencies in the summary
+LATENCY_PERCENTILES = (50, 95, 99)
+
+
+class TransactionLifecycle:
+    """ Defines a columnar store of the stages reached by the transactions of the world
+    transaction table (`env.transactions`), indexed by transaction ID like the table.
+
+    Each stage is a `float32` column with the delay in seconds from the creation of the
+    transaction (its `created` time) to the first time it reached the stage, or NaN if it
+    did not, so a transaction costs 4 bytes per stage. Columns double their capacity when
+    a transaction beyond them reaches a stage.
+
+    Stages (pBFT):
+
+    :param queued: queued by the primary that pre-prepares it
+    :param pre_prepared: pre-prepared in a block by the primary
+    :param prepared: its block is prepared by 2f+1 authorities
+    :param committed: its block is executed by all the honest authorities
+    :param replied: a client node accepts its block from the replies of the authorities
+    """
+
+    STAGES = ('queued', 'pre_prepared', 'prepared', 'committed', 'replied')
+
+    def __init__(self, env, capacity=1024):
+        self._env = env
+        self._columns = {stage: np.full(capacity, np.nan, dtype=np.float32) for stage in self.STAGES}
+
+    @property
+    def capacity(self):
+        return len(self._columns['queued'])
+
+    @property
+    def nbytes(self):
+        """Memory used by the columns in bytes"""
+        return sum(column.nbytes for column in self._columns.values())
+
+    def _fit(self, tx_id):
+        """Grows the columns to hold `tx_id`"""
+        capacity = self.capacity
+        if tx_id < capacity:
+            return
+        capacity = max(capacity, 1)
+        while capacity <= tx_id:
+            capacity *= 2
+        for stage, column in self._columns.items():
+            grown = np.full(capacity, np.nan, dtype=np.float32)
+            grown[:len(column)] = column
+            self._columns[stage] = grown
+
+    def mark(self, stage: str, txs, at):
+        """Records that the transactions `txs` reached a `stage` at the simulated time `at`
+        (a scalar or an array with a time per transaction). Only the first time counts"""
+        txs = np.asarray(txs)
+        if len(txs) == 0:
+            return
+        self._fit(int(txs.max()))
+        column = self._columns[stage]
+        first = np.isnan(column[txs])
+        if not first.any():
+            return
+        created = self._env.transactions.column('created')[txs]
+        delays = np.asarray(at, dtype=np.float64) - created
+        column[txs[first]] = delays[first]
+
+    def column(self, stage: str):
+        """Returns the delays of a `stage` for all the transactions of the table"""
+        n = len(self._env.transactions)
+        self._fit(n - 1)
+        return self._columns[stage][:n]
+
+    def summary(self, regions: list):
+        """Returns the latency percentiles of each stage, for all the transactions and per
+        region: `regions` has the region (e.g. the location) of each sender index"""
+        senders = self._env.transactions.column('sender')
+        groups = {'all': np.ones(len(senders), dtype=bool)}
+        sender_regions = np.asarray(regions, dtype=object)[senders] if len(senders) else np.empty(0, dtype=object)
+        for region in dict.fromkeys(regions):
+            groups[region] = sender_regions == region
+        return {
+            region: {stage: _latency_summary(self.column(stage)[selected]) for stage in self.STAGES}
+            for region, selected in groups.items()}
+
+
+def _latency_summary(delays):
+    reached = delays[~np.isnan(delays)].astype(np.float64)
+    if len(reached) == 0:
+        return {'count': 0}
+    percentiles = np.percentile(reached, LATENCY_PERCENTILES).tolist()
+    return dict({'count': len(reached), 'mean': float(reached.mean())},
+                **{f'p{p}': value for p, value in zip(LATENCY_PERCENTILES, percentiles)})
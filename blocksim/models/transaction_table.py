@@ -0,0 +1,99 @@
+import numpy as np
+
+# Data type of the transaction IDs carried by messages, queues and blocks
+TX_ID_DTYPE = np.int64
+# Receiver of the transactions without a known destination node
+NO_RECEIVER = -1
+
+
+class TransactionTable:
+    """ Defines a columnar store for the transactions created during the simulation.
+
+    Each transaction is a row of the table, and everywhere else in the simulation (messages,
+    transaction queues and blocks) it is referenced by its integer ID, which is the row number.
+    Columns are NumPy arrays that double their capacity when full, so memory is a few bytes
+    per transaction instead of one Python object for each of them.
+
+    Columns:
+
+    :param sender: index of the node that created the transaction
+    :param receiver: index of the destination node, or `NO_RECEIVER`
+    :param value: amount to send to destination
+    :param fee: a fee destinated to the node that will insert the transaction on the chain
+    :param created: simulated time at which the transaction is injected in the network
+    """
+
+    COLUMNS = (
+        ('sender', np.int32),
+        ('receiver', np.int32),
+        ('value', np.float64),
+        ('fee', np.float64),
+        ('created', np.float64)
+    )
+
+    def __init__(self, capacity=1024):
+        self._size = 0
+        self._columns = {
+            name: np.empty(capacity, dtype=dtype) for name, dtype in self.COLUMNS}
+
+    @classmethod
+    def from_columns(cls, columns: dict):
+        """Creates a table with the given column arrays, e.g. memory-mapped from a world
+        snapshot (see `blocksim.snapshot`). Read-only columns are copied the first time
+        transactions are added"""
+        table = cls(capacity=0)
+        table._columns = {name: columns[name] for name, _ in cls.COLUMNS}
+        table._size = len(table._columns['created'])
+        return table
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def capacity(self):
+        return len(self._columns['created'])
+
+    @property
+    def nbytes(self):
+        """Memory used by the columns in bytes"""
+        return sum(column.nbytes for column in self._columns.values())
+
+    def _reserve(self, n):
+        """Makes sure that `n` more transactions fit in the table"""
+        capacity = self.capacity
+        if self._size + n <= capacity and self._columns['created'].flags.writeable:
+            return
+        capacity = max(capacity, 1)
+        while capacity < self._size + n:
+            capacity *= 2
+        for name, column in self._columns.items():
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self._size] = column[:self._size]
+            self._columns[name] = grown
+
+    def add(self, sender, receiver=NO_RECEIVER, value=0, fee=0, created=0):
+        """Adds a transaction and returns its ID"""
+        return int(self.add_many(1, sender, receiver, value, fee, created)[0])
+
+    def add_many(self, n, sender, receiver=NO_RECEIVER, value=0, fee=0, created=0):
+        """Adds `n` transactions and returns an array with their IDs.
+        Each column value can be a scalar shared by all transactions or an array of `n` values"""
+        self._reserve(n)
+        start, end = self._size, self._size + n
+        values = dict(sender=sender, receiver=receiver, value=value, fee=fee, created=created)
+        for name, column in self._columns.items():
+            column[start:end] = values[name]
+        self._size = end
+        return np.arange(start, end, dtype=TX_ID_DTYPE)
+
+    def column(self, name):
+        """Returns a read-only view of the column `name` for all transactions in the table"""
+        view = self._columns[name][:self._size]
+        view.flags.writeable = False
+        return view
+
+    def get(self, tx_id):
+        """Returns the columns of a transaction as a dict"""
+        if not 0 <= tx_id < self._size:
+            raise KeyError(f'Transaction {tx_id} does not exist')
+        return {name: column[tx_id].item() for name, column in self._columns.items()}
@@ -1,56 +1,102 @@
+import hashlib
 import json
 import os
+import shutil
 import time
 from pathlib import Path
 from datetime import datetime
+import numpy as np
 
 from blocksim.models.pbft_network import PBFTNetwork as Network
+from blocksim.models.time_series import TimeSeriesSampler
 from blocksim.permissioned_node_factory import PermNodeFactory
 from blocksim.pbft_transaction_factory import PBFTTransactionFactory
 from blocksim.world import SimulationWorld
+from blocksim.snapshot import WorldSnapshot, save_world, snapshot_path, read_meta
+from blocksim.checkpoint import Checkpoint, save_checkpoint, checkpoint_path
 
 
-def write_report(world, prefix=''):
-    path = Path.cwd() / 'blocksim' / 'output' / (prefix + '_' + 'report.json')
-    
-    with open(path, 'w') as f:
-        json.dump(world.env.data, f, indent=2)
+def report_path(prefix='', output_dir=None):
+    if output_dir is None:
+        output_dir = Path.cwd() / 'blocksim' / 'output'
+    return Path(output_dir) / (prefix + '_' + 'report.json')
+
+
+def write_report(world, prefix='', output_dir=None):
+    world.env.report.close(world.env.data, report_path(prefix, output_dir))
 
 
 def report_node_chain(world, nodes_list):
     for node in nodes_list:
         head = node.chain.head
-        chain_list = []
-        num_blocks = 0
-        for i in range(head.header.number):
-            b = node.chain.get_block_by_number(i)
-            chain_list.append(str(b.header))
-            num_blocks += 1
-        chain_list.append(str(head.header))
+        num_blocks = head.header.number
+        # The blocks of the chain are a table of the report
+        if world.env.report.wants('chains'):
+            headers = [str(node.chain.get_block_by_number(i).header) for i in range(num_blocks)]
+            headers.append(str(head.header))
+            world.env.report.rows(
+                'chains', node=[node.address] * len(headers),
+                number=list(range(len(headers))), header=headers)
         key = f'{node.address}_chain'
         world.env.data[key] = {
             'head_block_hash': f'{head.header.hash[:8]} #{head.header.number}',
-            'number_of_blocks': num_blocks,
-            'chain_list': chain_list
+            'number_of_blocks': num_blocks
         }
 
 
-def run_model(json_file='tx_count_100.json', day=1):
-    if day > 1:
-        run_model(json_file, day-1)
+def report_tx_lifecycle(world, nodes_list):
+    """Summarizes the latencies of the transactions from their creation to each stage, per
+    region of their sender, and writes the stages of every transaction to the
+    `tx_lifecycle` table of the report"""
+    lifecycle = world.env.tx_lifecycle
+    world.env.data['tx_latency'] = lifecycle.summary([node.location for node in nodes_list])
+    if world.env.report.wants('tx_lifecycle'):
+        transactions = world.env.transactions
+        world.env.report.rows(
+            'tx_lifecycle', tx=np.arange(len(transactions)), sender=transactions.column('sender'),
+            created=transactions.column('created'),
+            **{stage: lifecycle.column(stage) for stage in lifecycle.STAGES})
+
+
+def is_from_run(path, meta):
+    """Tells if the snapshot or checkpoint in `path` was written by a run with the given `meta`"""
+    saved = read_meta(path)
+    return saved is not None and all(saved.get(key) == value for key, value in meta.items())
+
+
+def file_digest(path):
+    """SHA-256 of the contents of a file, to tell if an input changed since a snapshot"""
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
 
-    now = int(time.time())  # Current time
+def chains_path(output_dir=None):
+    """Directory of the snapshots and checkpoints of the days of a run"""
+    if output_dir is None:
+        return Path.cwd() / 'blocksim' / 'chains'
+    return Path(output_dir) / 'chains'
+
+
+def build_model(json_file, day, seed, config_file, chains_dir, checkpoint=None):
+    """Builds the world, network and nodes of a `day`, ready to be run: from the `checkpoint`
+    when given, else with the chains of the previous day snapshot and the transactions of
+    the day to broadcast"""
+    if config_file is None:
+        config_file = Path.cwd() / 'dlasc-input-parameters' / 'config.json'
+
+    now = int(time.time()) if checkpoint is None else checkpoint.start  # Current time
     duration = 100  # seconds
 
     world = SimulationWorld(
         duration,
         now,
-        Path.cwd() / 'dlasc-input-parameters' / 'config.json',
+        config_file,
         Path.cwd() / 'dlasc-input-parameters' / 'latency.json',
         Path.cwd() / 'dlasc-input-parameters' / 'throughput-received.json',
         Path.cwd() / 'dlasc-input-parameters' / 'throughput-sent.json',
         Path.cwd() / 'dlasc-input-parameters' / 'delays.json',
-        day
+        day,
+        seed
         )
 
     # Create the network
@@ -66,24 +112,84 @@ def run_model(json_file='tx_count_100.json', day=1):
     # Notice that the miner/non_miners this useless here, they're specified in
     # dlasc_node_factory
     nodes_list = node_factory.create_nodes(miners, non_miners)
-    # Start the network heartbeat
-    world.env.process(network.start_heartbeat())
+    if checkpoint is None:
+        # Start the network heartbeat
+        world.env.process(network.start_heartbeat())
+        time_series = world.env.config.get('time_series')
+        if time_series is not None:
+            network.sampler = TimeSeriesSampler(world.env, network, time_series.get('interval', 1), world.end)
+            world.env.process(network.sampler.run())
 
     # Full Connect all nodes
     for node in nodes_list:
         node.connect(nodes_list)
+    if checkpoint is not None:
+        checkpoint.restore(world, network, nodes_list)
+    else:
         if day > 1:
-            node.restore_chains(day-1)
-
-    transaction_factory = PBFTTransactionFactory(world)
-    transaction_factory.broadcast(json_file, 0.0001, nodes_list)
-
+            # Keep the chains and the transactions they reference from the previous day
+            snapshot = WorldSnapshot(snapshot_path(chains_dir, day-1))
+            snapshot.restore_transactions(world.env)
+            snapshot.restore_chains(world.env, nodes_list)
+
+        transaction_factory = PBFTTransactionFactory(world)
+        transaction_factory.broadcast(json_file, 0.0001, nodes_list)
+    return world, network, nodes_list
+
+
+def run_model(json_file='tx_count_100.json', day=1, seed=None, config_file=None, output_dir=None,
+              checkpoint_every=None, resume=False, branch_from=None):
+    """Runs the pBFT model for a `day`, from the world snapshot of the previous day.
+
+    The previous days are only simulated when there is no snapshot of the previous day from
+    a run with the same transactions, seed and config, files whose contents are compared
+    by digest. `seed` makes the run reproducible, `config_file` replaces the default
+    config.json, and `output_dir` isolates the report and the snapshots of the run in its
+    own directory.
+
+    `checkpoint_every` writes a checkpoint of the day every given simulated seconds (it
+    needs the inbox delivery), and `resume` continues the day from its last checkpoint,
+    e.g. after the process was interrupted. `branch_from` continues the day from the
+    checkpoint in that directory instead, with this run's config (a what-if branch)."""
+    chains_dir = chains_path(output_dir)
+    chains_dir.mkdir(parents=True, exist_ok=True)
+    default_config_file = Path.cwd() / 'dlasc-input-parameters' / 'config.json'
+    meta = dict(
+        json_file=str(json_file), seed=seed, config_file=str(config_file),
+        json_digest=file_digest(Path.cwd() / 'supply-chain-input-data' / json_file),
+        config_digest=file_digest(default_config_file if config_file is None else config_file))
+    checkpoint = None
+    if branch_from is not None:
+        checkpoint = Checkpoint(branch_from)
+    elif resume and is_from_run(checkpoint_path(chains_dir, day), dict(meta, day=day)):
+        checkpoint = Checkpoint(checkpoint_path(chains_dir, day))
+    elif day > 1 and not is_from_run(snapshot_path(chains_dir, day-1), dict(meta, day=day-1)):
+        run_model(json_file, day-1, seed, config_file, output_dir)
+
+    world, network, nodes_list = build_model(json_file, day, seed, config_file, chains_dir, checkpoint)
+
+    # Stream the report tables during the run
+    world.env.report.open(report_path('16_2', output_dir))
+    if checkpoint_every:
+        at = world.env.now + checkpoint_every
+        while at < world.end:
+            saved = save_checkpoint(
+                world, network, nodes_list, checkpoint_path(chains_dir, day), at, day=day, **meta)
+            if saved is None:
+                break
+            at = saved + checkpoint_every
     world.start_simulation()
+    world.env.data['commit_latency'] = network.commit_latency_summary()
+    report_tx_lifecycle(world, nodes_list)
+    if network.sampler is not None:
+        network.sampler.report(world.env.report)
+        world.env.data['time_series'] = network.sampler.summary()
     report_node_chain(world, nodes_list)
-    write_report(world, '16_2')
+    write_report(world, '16_2', output_dir)
 
-    for node in nodes_list:
-        node.save_chains(day)
+    save_world(world, nodes_list, snapshot_path(chains_dir, day), day=day, **meta)
+    # The day is over, its snapshot replaces the checkpoint
+    shutil.rmtree(checkpoint_path(chains_dir, day), ignore_errors=True)
 
     date_format = '%m-%d %H:%M:%S'
     t_delta = datetime.strptime(world.env.data['end_simulation_time'], date_format) - \
@@ -48,6 +48,7 @@ class PBFTTransactionFactory(PermTransactionFactory):
             else:
                 today = self._world.env.data['day']
                 sum_tx = all_days_tx[today][1:]
+                node_tx_array = np.array([sum_tx])
 
         # Jiali: Here we implement the paired transaction dictionary to count international tx.
         paired = False
@@ -55,56 +56,42 @@ class PBFTTransactionFactory(PermTransactionFactory):
         with dict_path.open() as df:
             paired_tx = json.load(df)
 
-        blockchain_switcher = {
-            'poa': self._generate_poa_tx,
-            'pbft': self._generate_pbft_tx,
-            'bitcoin': self._generate_bitcoin_tx,
-            'ethereum': self._generate_ethereum_tx
-        }
-
         if paired:
             international_tx = 0
             for sender in paired_tx.keys():
-                transactions = []
+                pairs = []
                 for j in paired_tx[sender].keys():
                     n_tx = paired_tx[sender][j]
                     i = int(sender)
                     j = int(j)
                     j = min(j, len(nodes_list) - 1)
-                    for _i in range(n_tx):
-                        sign = '-'.join([nodes_list[i].address, nodes_list[j].address, str(_i)])
-                        tx = blockchain_switcher.get(self._world.blockchain, lambda: "Invalid blockchain")(sign, i)
-                        transactions.append(tx)
+                    sign_prefix = '-'.join([nodes_list[i].address, nodes_list[j].address])
+                    pairs.append((j, n_tx, sign_prefix))
 
                     if nodes_list[i].address[7] != nodes_list[j].address[7]:
                         self._world.env.data['international_transactions'] += n_tx
 
-                self._world.env.process(self._set_interval(nodes_list[i], transactions, interval * i))
+                # Like the other transactions, they are created when they are injected
+                self._world.env.process(self._set_interval(nodes_list[i], i, pairs, interval * i))
         else:
             for i in range(min(len(nodes_list), len(sum_tx))):
-                transactions = []
-                for _i in range(sum_tx[i]):
-                    # Generate a random string to a transaction be distinct from others
-                    # rand_sign = ''.join(
-                    #     choices(string.ascii_letters + string.digits, k=20))
-                    sign = '- '.join(
-                        [today, nodes_list[i].address, str(_i), str(self._world.env.data['created_transactions'])])
-
-                    tx = blockchain_switcher.get(self._world.blockchain, lambda: "Invalid blockchain")(sign, i)
-                    transactions.append(tx)
+                sign_prefix = '- '.join(
+                    [today, nodes_list[i].address, str(self._world.env.data['created_transactions'])])
+                # Transactions are created lazily, day by day, as the simulation advances
+                self._world.env.process(self._inject_transactions(
+                    nodes_list[i], i, node_tx_array[:, i], interval * i, sign_prefix))
 
-                self._world.env.process(self._set_interval(nodes_list[i], transactions, interval * i))
-
-    def _set_interval(self, node, tx, interval):
+    def _set_interval(self, node, i, pairs, interval):
+        """Injects the paired transactions of the node `i` after `interval` seconds. `pairs`
+        has the receiver, number of transactions and sign prefix of each pair"""
         event = simpy.events.Timeout(self._world.env, delay=interval, value=interval)
         value = yield event
+        tx = self._join_txs([
+            self._generate_txs(n_tx, i, sign_prefix, self._world.env.now, receiver=j)
+            for j, n_tx, sign_prefix in pairs])
         self._world.env.process(
             node.broadcast_transactions(tx))
         if self.verbose:
             print(f'{time(self._world.env)}, now {value} seconds have passed')
         self._world.env.data['created_transactions'] += len(tx)
         # yield self._world.env.timeout(interval)
-
-    def _generate_pbft_tx(self, rand_sign, i):
-        tx = Transaction('address', 'address', 140, rand_sign, 50)
-        return tx
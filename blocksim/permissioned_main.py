@@ -9,30 +9,28 @@ from blocksim.permissioned_transaction_factory import PermTransactionFactory
 from blocksim.world import SimulationWorld
 
 
-def write_report(world):
-    path = Path.cwd() / 'blocksim' / 'output' / 'report.json'
-    # if not os.path.exists(path):
-    #     os.mkdir('output')
+REPORT_PATH = Path.cwd() / 'blocksim' / 'output' / 'report.json'
+
 
-    with open(path, 'w') as f:
-        json.dump(world.env.data, f, indent=2)
+def write_report(world):
+    world.env.report.close(world.env.data, REPORT_PATH)
 
 
 def report_node_chain(world, nodes_list):
     for node in nodes_list:
         head = node.chain.head
-        chain_list = []
-        num_blocks = 0
-        for i in range(head.header.number):
-            b = node.chain.get_block_by_number(i)
-            chain_list.append(str(b.header))
-            num_blocks += 1
-        chain_list.append(str(head.header))
+        num_blocks = head.header.number
+        # The blocks of the chain are a table of the report
+        if world.env.report.wants('chains'):
+            headers = [str(node.chain.get_block_by_number(i).header) for i in range(num_blocks)]
+            headers.append(str(head.header))
+            world.env.report.rows(
+                'chains', node=[node.address] * len(headers),
+                number=list(range(len(headers))), header=headers)
         key = f'{node.address}_chain'
         world.env.data[key] = {
             'head_block_hash': f'{head.header.hash[:8]} #{head.header.number}',
-            'number_of_blocks': num_blocks,
-            'chain_list': chain_list
+            'number_of_blocks': num_blocks
         }
 
 
@@ -86,6 +84,8 @@ def run_model(json_file='tx_count_10000.json'):
     transaction_factory = PermTransactionFactory(world)
     transaction_factory.broadcast(json_file, .1, nodes_list)
 
+    # Stream the report tables during the run
+    world.env.report.open(REPORT_PATH)
     world.start_simulation()
     report_node_chain(world, nodes_list)
     write_report(world)
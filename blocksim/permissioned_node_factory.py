@@ -87,13 +87,20 @@ class PermNodeFactory(NodeFactory):
             nodes_malicious = {rows[0]: rows[7] for rows in reader}
 
             print(node_region)
+        # The number of malicious authorities can be set in the config, overriding the csv
+        malicious_nodes = self._world.env.config['pbft'].get('malicious_nodes')
+        malicious_model = self._world.env.config['pbft'].get('malicious_model', MaliciousModel.PASSIVE.value)
         # node_id = 0  # Unique ID for each node
         nodes_list = []
         replica_id = 0
+        authorities = 0
         for node_id, region_id in node_region.items():
             node_address = f'region_{region_id}-no_{node_id}'
             is_malicious = int(nodes_malicious[node_id])
             if int(region_id) <= 3:
+                if malicious_nodes is not None:
+                    is_malicious = malicious_model if authorities < malicious_nodes else MaliciousModel.NOT_MALICIOUS.value
+                authorities += 1
                 # Create the authority nodes if node is in US
                 mega_hashrate_range = make_tuple('(20, 40)')
                 # Jiali: hashrate is no longer needed, but let's keep it in case.
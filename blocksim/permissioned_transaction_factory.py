@@ -2,10 +2,15 @@ import json
 from pathlib import Path
 from random import choices, randint
 from blocksim.transaction_factory import TransactionFactory
+from blocksim.utils import time, random_stream
 import numpy as np
 
 from blocksim.models.ethereum.transaction import Transaction as ETHTransaction
 from blocksim.models.transaction import Transaction
+from blocksim.models.transaction_table import NO_RECEIVER, TX_ID_DTYPE
+
+# Blockchains whose transactions are stored in the world transaction table
+TABLE_BLOCKCHAINS = ('poa', 'pbft')
 
 
 class PermTransactionFactory(TransactionFactory):
@@ -42,28 +47,92 @@ class PermTransactionFactory(TransactionFactory):
             # sum_tx = np.sum(node_tx_array, axis=0)
             sum_tx = all_days_tx[today][1:]
 
-        blockchain_switcher = {
-            'poa': self._generate_poa_tx,
-            'bitcoin': self._generate_bitcoin_tx,
-            'ethereum': self._generate_ethereum_tx
-        }
-
         for i in range(len(sum_tx)):
-            transactions = []
-            for _i in range(sum_tx[i]):
-                # Generate a random string to a transaction be distinct from others
-                # rand_sign = ''.join(
-                #     choices(string.ascii_letters + string.digits, k=20))
-                sign = '- '.join([today, nodes_list[i].address, str(_i), str(self._world.env.data['created_transactions'])])
-                tx = blockchain_switcher.get(self._world.blockchain, lambda: "Invalid blockchain")(sign, i)
-                transactions.append(tx)
-            self._world.env.data['created_transactions'] += len(transactions)
+            sign_prefix = '- '.join([today, nodes_list[i].address, str(self._world.env.data['created_transactions'])])
             # Choose the given node to broadcast the transaction
             self._world.env.process(
-                nodes_list[i].broadcast_transactions(transactions))
+                self._inject_transactions(nodes_list[i], i, [sum_tx[i]], 0, sign_prefix))
             # self._world.env.process(
             #     nodes_list[randint(0, len(nodes_list)-1)].broadcast_transactions(transactions))
-            self._world.env.process(self._set_interval(interval))
+
+    def _arrivals(self, daily_counts, i):
+        """Generates the `(wait, n)` pairs of the injection of the node `i`: wait `wait` seconds
+        and then inject `n` transactions. `daily_counts` is the number of transactions for each day.
+
+        The injection follows the `tx_injection` config:
+         - `all_at_once` (default): all the transactions of all days are injected at once.
+         - `daily`: the transactions of each day are injected at once, at the start of the day.
+         - `poisson`: the transactions of each day arrive as a Poisson process along the day,
+           and the arrivals of every `batch_interval` seconds are injected together. Each
+           node draws them from its own random stream (see `random_stream`).
+        A day lasts `seconds_per_day` simulated seconds."""
+        injection = self._world.env.config.get('tx_injection', {})
+        mode = injection.get('mode', 'all_at_once')
+        seconds_per_day = injection.get('seconds_per_day', 24 * 3600)
+        batch_interval = injection.get('batch_interval', 1)
+        if mode == 'all_at_once':
+            yield 0, int(np.sum(daily_counts))
+        elif mode == 'daily':
+            for day, count in enumerate(daily_counts):
+                yield (seconds_per_day if day > 0 else 0), int(count)
+        elif mode == 'poisson':
+            batches_per_day = max(int(seconds_per_day / batch_interval), 1)
+            arrivals = random_stream('tx_injection', self._world.env.data['day'], i)
+            # Empty batches only add to the waiting time of the next injection
+            wait = 0
+            for count in daily_counts:
+                rate = count / batches_per_day
+                for n in arrivals.poisson(rate, batches_per_day):
+                    wait += batch_interval
+                    if n > 0:
+                        yield wait, int(n)
+                        wait = 0
+        else:
+            raise ValueError(f'Invalid transaction injection mode {mode}')
+
+    def _inject_transactions(self, node, i, daily_counts, delay, sign_prefix):
+        """Process that injects the transactions of the node `i` after `delay` seconds, following
+        `_arrivals`. Transactions are created only when they are injected, so the ones still to
+        come take no memory. The created ones stay in the world transaction table, whose IDs
+        the blocks reference for the rest of the run."""
+        yield self._world.env.timeout(delay)
+        for wait, n in self._arrivals(daily_counts, i):
+            if wait > 0:
+                yield self._world.env.timeout(wait)
+            if n == 0:
+                continue
+            transactions = self._generate_txs(n, i, sign_prefix, self._world.env.now)
+            self._world.env.process(node.broadcast_transactions(transactions))
+            self._world.env.data['created_transactions'] += n
+            if self._world.env.config['verbose']:
+                print(f'{time(self._world.env)}: {n} transactions injected by {node.address}')
+
+    def _generate_txs(self, n, i, sign_prefix, created, receiver=NO_RECEIVER):
+        """Generates `n` transactions sent by the node `i`, to be injected at the `created` time.
+
+        The permissioned models reference transactions by their ID in the world transaction
+        table, so for them it returns an array of IDs. Other models get transaction objects."""
+        if self._world.blockchain in TABLE_BLOCKCHAINS:
+            return self._world.env.transactions.add_many(
+                n, sender=i, receiver=receiver, value=140, fee=50, created=created)
+
+        blockchain_switcher = {
+            'bitcoin': self._generate_bitcoin_tx,
+            'ethereum': self._generate_ethereum_tx
+        }
+        transactions = []
+        for _i in range(n):
+            # Generate a random string to a transaction be distinct from others
+            sign = '- '.join([sign_prefix, str(_i)])
+            tx = blockchain_switcher.get(self._world.blockchain, lambda: "Invalid blockchain")(sign, i)
+            transactions.append(tx)
+        return transactions
+
+    def _join_txs(self, groups):
+        """Joins groups of transactions generated by `_generate_txs`"""
+        if self._world.blockchain in TABLE_BLOCKCHAINS:
+            return np.concatenate(groups) if groups else np.empty(0, dtype=TX_ID_DTYPE)
+        return [tx for group in groups for tx in group]
 
     def _generate_bitcoin_tx(self, rand_sign, i):
         tx = Transaction('address', 'address', 140, rand_sign, 50)
@@ -74,8 +143,3 @@ class PermTransactionFactory(TransactionFactory):
         tx = ETHTransaction('address', 'address',
                             140, rand_sign, i, 2, gas_limit)
         return tx
-
-    def _generate_poa_tx(self, rand_sign, i):
-        tx = Transaction('address', 'address', 140, rand_sign, 50)
-        return tx
-
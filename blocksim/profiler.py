@@ -0,0 +1,167 @@
+import importlib
+import inspect
+from itertools import repeat
+from time import perf_counter
+from simpy.core import EmptySchedule, StopSimulation
+from simpy.events import URGENT, Condition, Event, Process
+
+# Node class of each blockchain, whose message dispatch is profiled
+PROFILED_NODES = {
+    'pbft': ('blocksim.models.pbft.node', 'PBFTNode'),
+    'poa': ('blocksim.models.poa.node', 'POANode'),
+    'ethereum': ('blocksim.models.ethereum.node', 'ETHNode'),
+    'bitcoin': ('blocksim.models.bitcoin.node', 'BTCNode')
+}
+# Prefixes of the node methods profiled as message handlers
+HANDLER_PREFIXES = ('_receive_', '_send_')
+KINDS = ('process', 'message', 'handler')
+
+
+def _step_name(event):
+    """Name of the process resumed by an event: the qualified name of its generator"""
+    for callback in event.callbacks or ():
+        owner = getattr(callback, '__self__', None)
+        if isinstance(owner, Process):
+            return owner._generator.__qualname__
+        if isinstance(owner, Condition):
+            return _step_name(owner)
+    return type(event).__name__
+
+
+class SimulationProfiler:
+    """Measures where the wall-clock time of a simulation goes (`profile` in the config).
+
+    While it is active (as a context manager), SimPy steps are timed under the name of the
+    process they resume, the message dispatch of the node class of the blockchain
+    (`_read_envelope`) is timed per message id, and each message handler (the `_receive_*`
+    and `_send_*` methods that are not processes) is timed by name. Times are inclusive: the
+    time of a message is also in the time of the process step that delivered it.
+
+    Timing every step and message would cost as much as a good part of the simulation, so
+    they are only timed in a `window` of consecutive steps out of every `sample_every`
+    steps, and the calls and seconds are estimated from these windows. The node class is
+    only instrumented during the windows, so the other steps run the original code, and
+    nothing is instrumented when profiling is off. With `window == sample_every` every step
+    is timed.
+    """
+
+    def __init__(self, env, blockchain: str, sample_every=1024, window=64):
+        if not 0 < window <= sample_every:
+            raise ValueError(f'The profile window ({window}) must be between 1 and sample_every ({sample_every})')
+        self.env = env
+        module_name, class_name = PROFILED_NODES[blockchain]
+        self.node_class = getattr(importlib.import_module(module_name), class_name)
+        self.sample_every = sample_every
+        self.window = window
+        # [calls, seconds] of each name, per kind
+        self.stats = {kind: {} for kind in KINDS}
+        self.wall_seconds = 0
+        self._originals = {}
+        self._wrappers = {}
+        for name, method in vars(self.node_class).items():
+            if name == '_read_envelope':
+                self._originals[name] = method
+                self._wrappers[name] = self._timed_dispatch(method)
+            elif (name.startswith(HANDLER_PREFIXES) and inspect.isfunction(method)
+                  and not inspect.isgeneratorfunction(method)):
+                self._originals[name] = method
+                self._wrappers[name] = self._timed_handler(name, method)
+
+    def _instrument(self, methods):
+        for name, method in methods.items():
+            setattr(self.node_class, name, method)
+
+    def _run(self, until):
+        """`Environment.run` until the simulated time `until`, timing a `window` of steps in
+        every `sample_every`"""
+        env = self.env
+        stop = Event(env)
+        stop._ok = True
+        stop._value = None
+        env.schedule(stop, URGENT, until - env.now)
+        stop.callbacks.append(StopSimulation.callback)
+        step = env.step
+        queue = env._queue
+        stats = self.stats['process']
+        untimed = self.sample_every - self.window
+        try:
+            while True:
+                for _ in repeat(None, untimed):
+                    step()
+                self._instrument(self._wrappers)
+                try:
+                    for _ in repeat(None, self.window):
+                        name = _step_name(queue[0][3]) if queue else 'empty'
+                        start = perf_counter()
+                        step()
+                        elapsed = perf_counter() - start
+                        entry = stats.get(name)
+                        if entry is None:
+                            entry = stats[name] = [0, 0.0]
+                        entry[0] += 1
+                        entry[1] += elapsed
+                finally:
+                    self._instrument(self._originals)
+        except (StopSimulation, EmptySchedule):
+            pass
+
+    def _timed_dispatch(self, method):
+        stats = self.stats['message']
+
+        def _read_envelope(node, envelope):
+            start = perf_counter()
+            method(node, envelope)
+            elapsed = perf_counter() - start
+            name = envelope.msg['id']
+            entry = stats.get(name)
+            if entry is None:
+                entry = stats[name] = [0, 0.0]
+            entry[0] += 1
+            entry[1] += elapsed
+        return _read_envelope
+
+    def _timed_handler(self, name, method):
+        entry = self.stats['handler'].setdefault(name, [0, 0.0])
+
+        def handler(node, *args):
+            start = perf_counter()
+            result = method(node, *args)
+            entry[1] += perf_counter() - start
+            entry[0] += 1
+            return result
+        handler.__name__ = name
+        return handler
+
+    def __enter__(self):
+        # The instance attribute is used by `SimulationWorld.run`
+        self.env.run = self._run
+        self._started = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.wall_seconds += perf_counter() - self._started
+        del self.env.run
+        return False
+
+    def _rows(self, kind):
+        """(name, calls, seconds) of a kind estimated from the windows, the most expensive first"""
+        scale = self.sample_every / self.window
+        rows = [(name, round(calls * scale), seconds * scale)
+                for name, (calls, seconds) in self.stats[kind].items() if calls]
+        return sorted(rows, key=lambda row: -row[2])
+
+    def summary(self):
+        """Returns the calls and seconds of each process, message id and handler, for the report"""
+        return dict({
+            kind: {name: {'calls': calls, 'seconds': seconds} for name, calls, seconds in self._rows(kind)}
+            for kind in KINDS}, wall_seconds=self.wall_seconds, sample_every=self.sample_every, window=self.window)
+
+    def table(self):
+        """Returns the profile as a text table, the most expensive first in each kind"""
+        lines = [f'{"kind":<8} {"name":<48} {"calls":>10} {"seconds":>10} {"us/call":>9} {"% wall":>7}']
+        for kind in KINDS:
+            for name, calls, seconds in self._rows(kind):
+                share = 100 * seconds / self.wall_seconds if self.wall_seconds else 0
+                lines.append(
+                    f'{kind:<8} {name[:48]:<48} {calls:>10} {seconds:>10.3f} {1e6 * seconds / calls:>9.1f} {share:>6.1f}%')
+        return '\n'.join(lines)
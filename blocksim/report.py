@@ -0,0 +1,150 @@
+import csv
+import json
+from pathlib import Path
+import numpy as np
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Metric groups that can be selected in the `report` config
+REPORT_GROUPS = (
+    'summary', 'chains', 'propagation', 'propagation_events', 'commits', 'tx_lifecycle', 'time_series')
+DEFAULT_GROUPS = ('summary', 'chains', 'propagation', 'commits', 'time_series')
+REPORT_FORMATS = ('auto', 'parquet', 'csv', 'npz')
+# Per-pair matrices of the propagation summaries, only kept with the `propagation` group
+PROPAGATION_MATRICES = ('nodes', 'pair_count', 'pair_mean')
+
+
+class ReportWriter:
+    """Writes the report of a simulation, as selected by the `report` entry of the config:
+
+    - `groups`: metric groups to persist, out of `REPORT_GROUPS`
+    - `format`: format of the tables, `parquet` (needs pyarrow), `csv` or `npz`.
+      `auto` uses parquet when pyarrow is installed and npz otherwise
+    - `flush_rows`: number of buffered rows of a table before it is written
+
+    Tables (e.g. the blocks of each chain, or every propagation sample) are streamed during
+    the run: rows are buffered by columns and appended to `<report>_<group>.parquet|csv` (or
+    written as `<report>_<group>_<chunk>.npz` files) when the buffer is full, once the report
+    is open. The scalar results and summaries of `env.data` are written at the end to the
+    `<report>.json` file.
+    """
+
+    def __init__(self, config: dict):
+        self.groups = set(config.get('groups', DEFAULT_GROUPS))
+        unknown = self.groups - set(REPORT_GROUPS)
+        if unknown:
+            raise ValueError(f'Unknown report groups {sorted(unknown)}, expected some of {REPORT_GROUPS}')
+        self.format = config.get('format', 'auto')
+        if self.format not in REPORT_FORMATS:
+            raise ValueError(f'Unknown report format {self.format}, expected one of {REPORT_FORMATS}')
+        if self.format == 'auto':
+            self.format = 'parquet' if pa is not None else 'npz'
+        elif self.format == 'parquet' and pa is None:
+            raise ImportError('The parquet report format needs pyarrow to be installed')
+        self.flush_rows = config.get('flush_rows', 100000)
+        self.path = None
+        self._buffers = {}
+        self._buffered_rows = {}
+        self._chunks = {}
+        self._writers = {}
+        # Parquet tables restored from a checkpoint are written to new part files
+        self._part = 0
+
+    def __getstate__(self):
+        # Open parquet writers can not be saved (see `blocksim.checkpoint`)
+        state = dict(self.__dict__, _writers={})
+        if self._writers:
+            state['_part'] = self._part + 1
+        return state
+
+    def wants(self, group: str):
+        """Tells if the metric `group` is persisted"""
+        return group in self.groups
+
+    def open(self, path):
+        """Sets the `path` of the JSON report, next to which the tables are written,
+        and writes the rows buffered so far"""
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        for group in list(self._buffers):
+            if self._buffered_rows[group] >= self.flush_rows:
+                self.flush(group)
+
+    def event(self, group: str, **columns):
+        """Adds a row to the table of a `group` (ignored if the group is not selected)"""
+        if group not in self.groups:
+            return
+        buffer = self._buffers.setdefault(group, {name: [] for name in columns})
+        for name, value in columns.items():
+            buffer[name].append(value)
+        self._buffered(group, 1)
+
+    def rows(self, group: str, **columns):
+        """Adds many rows to the table of a `group`, each column is a list or an array"""
+        if group not in self.groups:
+            return
+        buffer = self._buffers.setdefault(group, {name: [] for name in columns})
+        for name, values in columns.items():
+            buffer[name].extend(values)
+        self._buffered(group, len(next(iter(columns.values()))))
+
+    def _buffered(self, group, n):
+        self._buffered_rows[group] = self._buffered_rows.get(group, 0) + n
+        if self.path is not None and self._buffered_rows[group] >= self.flush_rows:
+            self.flush(group)
+
+    def flush(self, group: str):
+        """Writes the buffered rows of a `group`"""
+        buffer = self._buffers.pop(group, None)
+        self._buffered_rows[group] = 0
+        if not buffer:
+            return
+        columns = {name: np.asarray(values) for name, values in buffer.items()}
+        stem = self.path.with_suffix('')
+        if self.format == 'parquet':
+            table = pa.table(columns)
+            if group not in self._writers:
+                part = f'_part{self._part}' if self._part else ''
+                self._writers[group] = pq.ParquetWriter(f'{stem}_{group}{part}.parquet', table.schema)
+            self._writers[group].write_table(table)
+        elif self.format == 'csv':
+            path = Path(f'{stem}_{group}.csv')
+            new_file = group not in self._chunks
+            with open(path, 'w' if new_file else 'a', newline='') as f:
+                writer = csv.writer(f)
+                if new_file:
+                    writer.writerow(columns)
+                writer.writerows(zip(*(values.tolist() for values in columns.values())))
+            self._chunks[group] = 1
+        else:
+            chunk = self._chunks.get(group, 0)
+            np.savez_compressed(f'{stem}_{group}_{chunk:05d}.npz', **columns)
+            self._chunks[group] = chunk + 1
+
+    def close(self, data: dict, path=None):
+        """Writes the remaining rows and the JSON report with the results of `data` (`env.data`)
+        of the selected groups. `path` opens the report if it was not opened before"""
+        if path is not None and self.path is None:
+            self.open(path)
+        for group in list(self._buffers):
+            self.flush(group)
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+        if 'summary' in self.groups:
+            with open(self.path, 'w') as f:
+                json.dump(self.summary(data), f, indent=2)
+
+    def summary(self, data: dict):
+        """Returns the results of `data` to write in the JSON report"""
+        summary = dict(data)
+        if 'propagation' not in self.groups:
+            for key in ('tx_propagation', 'block_propagation'):
+                if isinstance(summary.get(key), dict):
+                    summary[key] = {
+                        name: value for name, value in summary[key].items()
+                        if name not in PROPAGATION_MATRICES}
+        return summary
@@ -0,0 +1,215 @@
+import json
+import pickle
+import shutil
+from pathlib import Path
+import numpy as np
+from blocksim.models.block import Block, BlockHeader
+from blocksim.models.chain import Chain
+from blocksim.models.chain_index import ChainIndex
+from blocksim.models.consensus import Consensus
+from blocksim.models.transaction_table import TransactionTable, TX_ID_DTYPE
+from blocksim.utils import get_random_state, set_random_state
+
+# Columns of the block headers in a snapshot
+BLOCK_COLUMNS = ('hash', 'prevhash', 'number', 'timestamp', 'coinbase', 'difficulty', 'nonce')
+# Attributes saved from the nodes that have them: PBFT logs, views and sequence numbers
+NODE_ATTRIBUTES = (
+    'log', 'preparemsg', 'current_view', 'current_sequence', 'currSeqno', 'lastCheckpoint', 'timedout')
+META_FILE = 'meta.json'
+STATE_FILE = 'state.pickle'
+
+
+def snapshot_path(chains_dir, day: int):
+    """Directory of the snapshot of a `day` in `chains_dir`"""
+    return Path(chains_dir) / f'day_{day}'
+
+
+def read_meta(path):
+    """Returns the metadata of the snapshot in `path`, or `None` if there is no complete snapshot"""
+    meta_file = Path(path) / META_FILE
+    if not meta_file.exists():
+        return None
+    with open(meta_file) as f:
+        return json.load(f)
+
+
+def open_snapshot_dir(path):
+    """Creates an empty temporary directory to write the snapshot of `path` into"""
+    tmp = Path(path).with_name(Path(path).name + '.tmp')
+    if tmp.exists():
+        shutil.rmtree(tmp)
+    tmp.mkdir(parents=True)
+    return tmp
+
+
+def commit_snapshot_dir(tmp, path):
+    """Replaces the snapshot in `path` with the one written in `tmp`"""
+    path = Path(path)
+    if path.exists():
+        shutil.rmtree(path)
+    tmp.rename(path)
+
+
+def write_transactions(path, table: TransactionTable):
+    """Writes the columns of a transactions table in the directory `path`"""
+    for name, _ in TransactionTable.COLUMNS:
+        np.save(Path(path) / f'transactions_{name}.npy', table.column(name))
+
+
+def read_transactions(path):
+    """Returns the transactions table written in `path`, with memory-mapped columns"""
+    return TransactionTable.from_columns({
+        name: np.load(Path(path) / f'transactions_{name}.npy', mmap_mode='r')
+        for name, _ in TransactionTable.COLUMNS})
+
+
+class _BlockPickler(pickle.Pickler):
+    """Pickles the blocks as references to the block columns of the snapshot"""
+
+    def __init__(self, file, blocks: dict):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.blocks = blocks
+
+    def persistent_id(self, obj):
+        if isinstance(obj, Block):
+            self.blocks.setdefault(obj.header.hash, obj)
+            return obj.header.hash
+        return None
+
+
+class _BlockUnpickler(pickle.Unpickler):
+    def __init__(self, file, blocks: dict):
+        super().__init__(file)
+        self.blocks = blocks
+
+    def persistent_load(self, block_hash):
+        return self.blocks[block_hash]
+
+
+def save_world(world, nodes, path, **meta):
+    """Writes a snapshot of the `world` and its `nodes` in the directory `path`.
+
+    The transactions table, the block headers and the transaction IDs of the blocks are
+    written as `.npy` columns, which are memory-mapped back by `WorldSnapshot`. Everything
+    else (the chain indexes, transaction queues and PBFT logs of the nodes, and the state of
+    the random streams) is a single pickle, where blocks are references to the columns.
+    `meta` is written along (e.g. the day and the seed) to tell which run the snapshot is from.
+    """
+    tmp = open_snapshot_dir(path)
+    env = world.env
+
+    stored = env.blocks.blocks
+    blocks = dict(stored)
+    state = {
+        'nodes': {node.address: _node_state(node) for node in nodes},
+        'random': get_random_state()
+    }
+    with open(tmp / STATE_FILE, 'wb') as f:
+        # Also collects the blocks that are only referenced by the logs (not stored yet)
+        _BlockPickler(f, blocks).dump(state)
+
+    write_transactions(tmp, env.transactions)
+
+    blocks = sorted(blocks.values(), key=lambda block: block.header.number)
+    for name in BLOCK_COLUMNS:
+        np.save(tmp / f'blocks_{name}.npy', np.array([
+            block.header.hash if name == 'hash' else getattr(block.header, name) for block in blocks]))
+    np.save(tmp / 'blocks_stored.npy', np.array([block.header.hash in stored for block in blocks], dtype=bool))
+    # Blocks without transactions (`None`, e.g. the genesis block) have a count of -1
+    tx_counts = np.array([
+        -1 if block.transactions is None else len(block.transactions) for block in blocks], dtype=np.int64)
+    np.save(tmp / 'blocks_tx_count.npy', tx_counts)
+    txs = [np.asarray(block.transactions, dtype=TX_ID_DTYPE) for block in blocks if block.transactions is not None]
+    np.save(tmp / 'blocks_txs.npy', np.concatenate(txs) if txs else np.empty(0, dtype=TX_ID_DTYPE))
+
+    with open(tmp / META_FILE, 'w') as f:
+        json.dump(meta, f, indent=2)
+    commit_snapshot_dir(tmp, path)
+
+
+def _node_state(node):
+    db = node.chain.db
+    state = {
+        'chain': {
+            'head': db.head,
+            'forks': db.forks,
+            'scores': db.scores,
+            'parent_queue': node.chain.parent_queue
+        }
+    }
+    for name in NODE_ATTRIBUTES:
+        if hasattr(node, name):
+            state[name] = getattr(node, name)
+    queue = getattr(node, 'transaction_queue', None)
+    if queue is not None:
+        state['transaction_queue'] = queue.pending()
+    return state
+
+
+class WorldSnapshot:
+    """A snapshot written by `save_world`, read back from the directory `path`.
+
+    Columns are memory-mapped: the transactions table and the transactions of the blocks are
+    only read from disk when they are used. The blocks (`blocks`) are built once for all the
+    nodes, and the `restore_*` methods put the saved state into a new world.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.meta = read_meta(self.path)
+        if self.meta is None:
+            raise FileNotFoundError(f'No world snapshot in {self.path}')
+        columns = {name: np.load(self.path / f'blocks_{name}.npy') for name in BLOCK_COLUMNS}
+        stored = np.load(self.path / 'blocks_stored.npy')
+        tx_counts = np.load(self.path / 'blocks_tx_count.npy')
+        txs = np.load(self.path / 'blocks_txs.npy', mmap_mode='r')
+        ends = np.cumsum(np.maximum(tx_counts, 0))
+
+        self.blocks = {}
+        self._stored = []
+        for i, tx_count in enumerate(tx_counts.tolist()):
+            header = BlockHeader(*(columns[name][i].item() for name in BLOCK_COLUMNS[1:]))
+            block_hash = columns['hash'][i].item()
+            # The hash is saved, not recomputed
+            object.__setattr__(header, '_hash', block_hash)
+            transactions = None if tx_count < 0 else txs[ends[i] - tx_count:ends[i]]
+            self.blocks[block_hash] = Block(header, transactions)
+            if stored[i]:
+                self._stored.append(block_hash)
+
+        with open(self.path / STATE_FILE, 'rb') as f:
+            self.state = _BlockUnpickler(f, self.blocks).load()
+
+    def restore_transactions(self, env):
+        """Replaces the transactions table of `env`, so the IDs in the blocks stay valid"""
+        env.transactions = read_transactions(self.path)
+
+    def restore_blocks(self, env):
+        """Adds the stored blocks to the block store of `env`, parents first"""
+        for block_hash in self._stored:
+            env.blocks.add(self.blocks[block_hash])
+
+    def restore_chains(self, env, nodes):
+        """Restores the blocks and the chain of each node, with the saved head as its genesis"""
+        self.restore_blocks(env)
+        for node in nodes:
+            saved = self.state['nodes'][node.address]['chain']
+            db = ChainIndex(env.blocks)
+            db.forks = saved['forks']
+            node.chain = Chain(env, node, Consensus(env), self.blocks[saved['head']], db)
+            db.scores = saved['scores']
+            node.chain.parent_queue = saved['parent_queue']
+
+    def restore_nodes(self, nodes):
+        """Restores the transaction queues and the PBFT logs of the nodes"""
+        for node in nodes:
+            saved = self.state['nodes'][node.address]
+            for name in NODE_ATTRIBUTES:
+                if name in saved:
+                    setattr(node, name, saved[name])
+            if 'transaction_queue' in saved:
+                node.transaction_queue.add_txs(saved['transaction_queue'])
+
+    def restore_random(self):
+        """Restores the random streams as they were when the snapshot was taken"""
+        set_random_state(self.state['random'])
@@ -0,0 +1,166 @@
+import csv
+import itertools
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from blocksim.pbft_main import run_model, build_model, chains_path
+from blocksim.checkpoint import save_checkpoint
+
+# Grid parameters and the pBFT config key they replace (None when they are not a config value)
+GRID_PARAMETERS = {
+    'tx_file': None,
+    'malicious_nodes': 'malicious_nodes',
+    'block_size': 'block_size_limit_mb',
+    'timeout': 'timeout',
+    'block_policy': 'block_policy',
+    'seed': None
+}
+# Delivery of the runs branched from a shared prefix, which must be checkpointed
+BRANCH_DELIVERY = 'inbox'
+
+
+def expand_grid(grid: dict):
+    """Expands a `grid` like { 'tx_file': [...], 'seed': [...], ... } into the list of all
+    combinations of its values, one dict per run. Parameters missing in the grid keep
+    the value of the default config."""
+    for name in grid:
+        if name not in GRID_PARAMETERS:
+            raise KeyError(f'Unknown sweep parameter {name}, expected one of {list(GRID_PARAMETERS)}')
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def _write_run_config(run, output_dir: Path, base_config_file: Path, delivery=None):
+    """Writes the config of a run, which is the base config with the run parameters applied"""
+    with open(base_config_file) as f:
+        config = json.load(f)
+    for name, value in run.items():
+        key = GRID_PARAMETERS[name]
+        if key is not None:
+            config['pbft'][key] = value
+    if delivery is not None:
+        config['delivery'] = delivery
+    # The results of a run are read from its JSON report, only written with the `summary` group
+    groups = config.get('report', {}).get('groups')
+    if groups is not None and 'summary' not in groups:
+        config['report']['groups'] = ['summary'] + list(groups)
+    config_file = output_dir / 'config.json'
+    with open(config_file, 'w') as f:
+        json.dump(config, f, indent=2)
+    return config_file
+
+
+def _prefix_key(run):
+    """Runs with the same transactions and seed share their prefix"""
+    return run.get('tx_file', 'tx_count_100.json'), run.get('seed')
+
+
+def _run_prefix(key, prefix: float, output_dir: Path, base_config_file: Path, day: int):
+    """Simulates the first `prefix` seconds of a day once with the base config, and writes the
+    checkpoint the runs of the `key` branch from. Returns the checkpoint directory, or `None`
+    if the day ended before a checkpoint could be taken"""
+    tx_file, seed = key
+    output_dir.mkdir(parents=True, exist_ok=True)
+    config_file = _write_run_config({}, output_dir, base_config_file, BRANCH_DELIVERY)
+    if day > 1:
+        run_model(tx_file, day - 1, seed, config_file, output_dir)
+    world, network, nodes = build_model(tx_file, day, seed, config_file, chains_path(output_dir))
+    path = output_dir / 'checkpoint'
+    if save_checkpoint(world, network, nodes, path, world.start + prefix) is None:
+        return None
+    return path
+
+
+def _run(run, output_dir: Path, base_config_file: Path, day: int, branch_from=None):
+    """Runs one simulation of the sweep in its own `output_dir` and returns its result row.
+    With `branch_from`, the simulation continues from that prefix checkpoint"""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    delivery = BRANCH_DELIVERY if branch_from is not None else None
+    config_file = _write_run_config(run, output_dir, base_config_file, delivery)
+    start_time = time.time()
+    simulated_time = run_model(
+        run.get('tx_file', 'tx_count_100.json'), day, run.get('seed'), config_file, output_dir,
+        branch_from=branch_from)
+    running_time = time.time() - start_time
+
+    with open(output_dir / '16_2_report.json') as f:
+        report = json.load(f)
+    chains = [value for key, value in report.items() if key.endswith('_chain')]
+    return dict(run,
+                output_dir=str(output_dir),
+                branch_from='' if branch_from is None else str(branch_from),
+                simulated_time=simulated_time,
+                running_time=running_time,
+                created_transactions=report['created_transactions'],
+                max_blocks=max(chain['number_of_blocks'] for chain in chains),
+                min_blocks=min(chain['number_of_blocks'] for chain in chains))
+
+
+def _seed_runs(runs, base_seed: int, prefix=None):
+    """Seeds the `runs` of a grid without a `seed` parameter: run n gets `base_seed + n`, or
+    with a `prefix`, the runs branched from prefix n all get `base_seed + n` (they go on with
+    the random state of the prefix)"""
+    if prefix:
+        keys = list(dict.fromkeys(_prefix_key(run) for run in runs))
+        seeds = {key: base_seed + n for n, key in enumerate(keys)}
+        return [dict(run, seed=seeds[_prefix_key(run)]) for run in runs]
+    return [dict(run, seed=base_seed + n) for n, run in enumerate(runs)]
+
+
+def run_sweep(grid: dict, output_root, max_workers=None, day=1, base_config_file=None, prefix=None, base_seed=0):
+    """Runs every combination of the `grid` (see `expand_grid`) as an independent simulation
+    in a pool of `max_workers` processes.
+
+    Each run gets its own directory `output_root/run_<n>` for its config, report and chains,
+    and is seeded with its `seed` parameter so it can be reproduced on its own. Without a
+    `seed` in the grid, the seeds are derived from `base_seed` (see `_seed_runs`).
+    The results of all runs, with their seed, are aggregated in `output_root/sweep_results.csv`,
+    and returned as a list of rows in the order of the grid.
+
+    With a `prefix` (simulated seconds), the first seconds of the day are simulated once for
+    each transactions file and seed, with the base config, in `output_root/prefix_<n>`. The
+    runs then branch from its checkpoint (see `blocksim.checkpoint`) with their own config,
+    so the prefix is not simulated again for each of them. Runs branched from a prefix use
+    the inbox delivery."""
+    output_root = Path(output_root)
+    output_root.mkdir(parents=True, exist_ok=True)
+    if base_config_file is None:
+        base_config_file = Path.cwd() / 'dlasc-input-parameters' / 'config.json'
+    runs = expand_grid(grid)
+    if 'seed' not in grid:
+        runs = _seed_runs(runs, base_seed, prefix)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        branches = {}
+        if prefix:
+            keys = list(dict.fromkeys(_prefix_key(run) for run in runs))
+            futures = [
+                executor.submit(_run_prefix, key, prefix, output_root / f'prefix_{n:04d}', base_config_file, day)
+                for n, key in enumerate(keys)]
+            branches = {key: future.result() for key, future in zip(keys, futures)}
+        futures = [
+            executor.submit(
+                _run, run, output_root / f'run_{n:04d}', base_config_file, day, branches.get(_prefix_key(run)))
+            for n, run in enumerate(runs)]
+        results = [future.result() for future in futures]
+
+    if results:
+        with open(output_root / 'sweep_results.csv', 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0]))
+            writer.writeheader()
+            writer.writerows(results)
+    return results
+
+
+if __name__ == '__main__':
+    main_folder = Path.cwd() / 'blocksim'
+    if not main_folder.exists():
+        raise Exception('Wrong working dir. Should be blocksim-dlasc')
+
+    grid = {
+        'tx_file': ['tx_count_' + str(i) + '000.json' for i in range(1, 11)],
+        'seed': list(range(3))
+    }
+    run_sweep(grid, Path.cwd() / 'blocksim' / 'output' / 'sweep')
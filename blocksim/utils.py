@@ -1,7 +1,10 @@
 import binascii
+import math
+import zlib
 from datetime import datetime
 import random
 from ast import literal_eval as make_tuple
+import numpy as np
 import scipy.stats
 try:
     from Crypto.Hash import keccak
@@ -15,30 +18,27 @@ except ImportError:
         return _sha3.keccak_256(value).digest()
 
 
-def get_latency_delay(env, origin: str, destination: str, n=1):
-    distribution = env.delays['LATENCIES'][origin][destination]
+def get_latency_delay(env, origin: int, destination: int, n=1):
+    sampler = env.delay_samplers['LATENCIES'][origin][destination]
     # Convert latency in ms to seconds
-    latencies = [
-        latency/1000 for latency in get_random_values(distribution, n)]
-    if len(latencies) == 1:
-        return round(latencies[0], 4)
-    else:
-        return latencies
+    if n == 1:
+        return round(sampler.draw_one() / 1000, 4)
+    return list(sampler.draw(n) / 1000)
 
 
-def get_received_delay(env, message_size: float, origin: str, destination: str, n=1):
+def get_received_delay(env, message_size: float, origin: int, destination: int, n=1):
     """
     It calculates and returns a delay when receiving/downloading a message with a certain size (`message_size`)
 
     :param message_size: message size in megabytes (MB)
-    :param origin: the location of the origin node
-    :param destination: the location of the destination node
+    :param origin: the location ID of the origin node
+    :param destination: the location ID of the destination node
     :param n: the number of delays returned
 
     If `n` is 1 it returns a `float`, if `n > 1` returns an array of `n` floats.
     """
-    distribution = env.delays['THROUGHPUT_RECEIVED'][origin][destination]
-    delay = _calc_throughput(distribution, message_size, n)
+    sampler = env.delay_samplers['THROUGHPUT_RECEIVED'][origin][destination]
+    delay = _calc_throughput(sampler, message_size, n)
     if delay < 0:
         raise RuntimeError(
             f'Negative received delay ({delay}) to origin {origin} and destination {destination}')
@@ -46,50 +46,207 @@ def get_received_delay(env, message_size: float, origin: str, destination: str,
         return delay
 
 
-def get_sent_delay(env, message_size: float, origin: str, destination: str, n=1):
+def get_sent_delay(env, message_size: float, origin: int, destination: int, n=1):
     """
     It calculates and returns a delay when sending/uploading a message with a certain size (`message_size`)
 
     :param message_size: message size in megabytes (MB)
-    :param origin: the location of the origin node
-    :param destination: the location of the destination node
+    :param origin: the location ID of the origin node
+    :param destination: the location ID of the destination node
     :param n: the number of delays returned
 
     If `n` is 1 it returns a `float`, if `n > 1` returns an array of `n` floats.
     """
-    distribution = env.delays['THROUGHPUT_SENT'][origin][destination]
+    sampler = env.delay_samplers['THROUGHPUT_SENT'][origin][destination]
     delay = -1
     while delay < 0:
-        delay = _calc_throughput(distribution, message_size, n)
+        delay = _calc_throughput(sampler, message_size, n)
     return delay
 
 
-def _calc_throughput(distribution: dict, message_size: float, n):
-    rand_throughputs = get_random_values(distribution, n)
-    delays = []
-    for throughput in rand_throughputs:
-        delay = (message_size * 8) / throughput
-        delays.append(delay)
-    if len(delays) == 1:
-        return round(delays[0], 3)
-    else:
-        return delays
+def get_sent_delays(env, message_size: float, origin: int, destinations):
+    """
+    Vectorized `get_sent_delay` for many destinations of the same message.
+
+    :param message_size: message size in megabytes (MB)
+    :param origin: the location ID of the origin node
+    :param destinations: an array of location IDs of the destination nodes
+
+    Returns an array with a delay for each destination. Delays are drawn with one call per
+    destination location, instead of one call per destination.
+    """
+    destinations = np.asarray(destinations)
+    delays = np.empty(len(destinations))
+    for destination in np.unique(destinations):
+        where = np.flatnonzero(destinations == destination)
+        sampler = env.delay_samplers['THROUGHPUT_SENT'][origin][destination]
+        group = np.round((message_size * 8) / sampler.draw(len(where)), 3)
+        # Negative delays are drawn again, as in `get_sent_delay`
+        negative = group < 0
+        while negative.any():
+            group[negative] = np.round(
+                (message_size * 8) / sampler.draw(np.count_nonzero(negative)), 3)
+            negative = group < 0
+        delays[where] = group
+    return delays
+
+
+def _calc_throughput(sampler, message_size: float, n):
+    if n == 1:
+        return round((message_size * 8) / sampler.draw_one(), 3)
+    return list((message_size * 8) / sampler.draw(n))
+
 
+def time(env, at=None):
+    """Formats the current simulated time, or the simulated time `at`"""
+    if at is None:
+        at = env.now
+    return datetime.utcfromtimestamp(at).strftime('%m-%d %H:%M:%S')
 
-def time(env):
-    return datetime.utcfromtimestamp(env.now).strftime('%m-%d %H:%M:%S')
+
+def timeout_at(env, at: float):
+    """Returns a timeout event triggered at exactly the simulated time `at`, e.g. to resume
+    a process waiting for it when a checkpoint was taken (see `blocksim.checkpoint`)"""
+    delay = max(at - env.now, 0)
+    # `now + (at - now)` can be off by one unit in the last place
+    while env.now + delay < at:
+        delay = math.nextafter(delay, math.inf)
+    while delay > 0 and env.now + delay > at:
+        delay = math.nextafter(delay, 0)
+    return env.timeout(delay)
 
 
 def kB_to_MB(value):
     return value / 1000
 
 
+# Number of random values pre-sampled every time a sampler buffer runs out
+SAMPLER_BATCH_SIZE = 4096
+
+
+class DistributionSampler:
+    """Serves random values of a distribution from a pre-sampled buffer.
+
+    The distribution is parsed and frozen once, and values are drawn from scipy in
+    batches of `batch_size`, so a call costs an array index instead of a scipy `rvs` call.
+
+    :param distribution: a distribution in the format { \'name\': str, \'parameters\': tuple as a string }
+    :param seed: seed (or `numpy.random.SeedSequence`) of the sampler random stream
+    :param batch_size: number of values sampled every time the buffer is refilled
+    """
+
+    def __init__(self, distribution: dict, seed=None, batch_size=SAMPLER_BATCH_SIZE):
+        dist = getattr(scipy.stats, distribution['name'])
+        param = make_tuple(distribution['parameters'])
+        self.frozen = dist(*param[:-2], loc=param[-2], scale=param[-1])
+        self.batch_size = batch_size
+        self._random_state = np.random.default_rng(seed)
+        self._buffer = np.empty(0)
+        self._position = 0
+
+    def _refill(self, n):
+        size = max(self.batch_size, n)
+        self._buffer = np.concatenate((
+            self._buffer[self._position:],
+            self.frozen.rvs(size=size, random_state=self._random_state)))
+        self._position = 0
+
+    def draw(self, n=1):
+        """Returns an array with the next `n` random values"""
+        if self._position + n > len(self._buffer):
+            self._refill(n)
+        values = self._buffer[self._position:self._position + n]
+        self._position += n
+        return values
+
+    def draw_one(self):
+        """Returns the next random value as a `float`"""
+        if self._position >= len(self._buffer):
+            self._refill(1)
+        value = self._buffer[self._position]
+        self._position += 1
+        return float(value)
+
+    def get_state(self):
+        """Returns the state of the random stream and the values buffered but not drawn yet"""
+        return self._random_state.bit_generator.state, self._buffer[self._position:].copy()
+
+    def set_state(self, state):
+        """Restores a state returned by `get_state`"""
+        self._random_state.bit_generator.state, buffer = state
+        self._buffer = np.array(buffer)
+        self._position = 0
+
+
+_samplers = {}
+_sampler_seed = None
+
+
+def seed_samplers(seed=None):
+    """Resets all the distribution samplers with a new `seed`.
+
+    Each distribution gets its own random stream derived from the `seed` and the
+    distribution itself, so a simulation with the same seed draws the same values
+    no matter in which order the distributions are first used.
+    It also seeds the `random` and `numpy.random` global generators used by the models."""
+    global _sampler_seed
+    _sampler_seed = seed
+    _samplers.clear()
+    if seed is not None:
+        random.seed(seed)
+        np.random.seed(seed)
+
+
+def get_sampler(distribution: dict):
+    """Returns the shared sampler of a `distribution`, creating it on first use"""
+    key = (distribution['name'], distribution['parameters'])
+    sampler = _samplers.get(key)
+    if sampler is None:
+        seed = None
+        if _sampler_seed is not None:
+            seed = np.random.SeedSequence(
+                [_sampler_seed, zlib.crc32(repr(key).encode('utf-8'))])
+        sampler = DistributionSampler(distribution, seed)
+        _samplers[key] = sampler
+    return sampler
+
+
+def random_stream(*key):
+    """Returns a new random generator with its own stream, derived from the seed of the
+    samplers and `key` like the streams of the samplers, so its draws do not change the
+    values drawn by the rest of the simulation"""
+    seed = None
+    if _sampler_seed is not None:
+        seed = np.random.SeedSequence([_sampler_seed, zlib.crc32(repr(key).encode('utf-8'))])
+    return np.random.default_rng(seed)
+
+
+def get_random_state():
+    """Returns the state of all the random streams of the simulation: the `random` and
+    `numpy.random` global generators and the distribution samplers"""
+    return {
+        'random': random.getstate(),
+        'numpy': np.random.get_state(),
+        'sampler_seed': _sampler_seed,
+        'samplers': {key: sampler.get_state() for key, sampler in _samplers.items()}
+    }
+
+
+def set_random_state(state: dict):
+    """Restores a state returned by `get_random_state`. The samplers already in use
+    (e.g. in `env.delay_samplers`) are restored in place"""
+    global _sampler_seed
+    random.setstate(state['random'])
+    np.random.set_state(state['numpy'])
+    _sampler_seed = state['sampler_seed']
+    for (name, parameters), sampler_state in state['samplers'].items():
+        get_sampler({'name': name, 'parameters': parameters}).set_state(sampler_state)
+
+
 def get_random_values(distribution: dict, n=1):
     """Receives a `distribution` and outputs `n` random values
     Distribution format: { \'name\': str, \'parameters\': tuple }"""
-    dist = getattr(scipy.stats, distribution['name'])
-    param = make_tuple(distribution['parameters'])
-    return dist.rvs(*param[:-2], loc=param[-2], scale=param[-1], size=n)
+    return get_sampler(distribution).draw(n)
 
 
 def decode_hex(s):
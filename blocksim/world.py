@@ -2,6 +2,13 @@ import json
 from datetime import datetime
 import simpy
 from schema import Schema, SchemaError
+from blocksim.utils import seed_samplers, get_sampler
+from blocksim.models.transaction_table import TransactionTable
+from blocksim.models.transaction_lifecycle import TransactionLifecycle
+from blocksim.profiler import SimulationProfiler
+from blocksim.models.chain_index import BlockStore
+from blocksim.models.propagation_metrics import PropagationMetrics
+from blocksim.report import ReportWriter
 
 
 class SimulationWorld:
@@ -13,11 +20,15 @@ class SimulationWorld:
                  measured_throughput_received,
                  measured_throughput_sent,
                  measured_delays,
-                 day: int=0):
+                 day: int=0,
+                 seed: int=None):
         self._measured_delays = self._read_json_file(measured_delays)
         self._sim_duration = sim_duration
         self._initial_time = initial_time
         self._config = self._read_json_file(config_file)
+        # Seed the random streams, a `seed` in the config file is used when none is given
+        self._seed = seed if seed is not None else self._config.get('seed')
+        seed_samplers(self._seed)
         self._measured_latency = measured_latency
         self._measured_throughput_received = measured_throughput_received
         self._measured_throughput_sent = measured_throughput_sent
@@ -27,6 +38,17 @@ class SimulationWorld:
         self._set_delays()
         self._set_latencies()
         self._set_throughputs()
+        self._compile_delays()
+        # Columnar store of the transactions referenced by ID in the permissioned models
+        self._env.transactions = TransactionTable()
+        # Stages reached by the transactions of the table, summarized as latencies at the end
+        self._env.tx_lifecycle = TransactionLifecycle(self._env)
+        # Blocks known by any node, stored once for all their chains
+        self._env.blocks = BlockStore()
+        # Report of the simulation, its tables are streamed during the run
+        self._env.report = ReportWriter(self._config.get('report', {}))
+        # Propagation times between nodes, summarized in the report at the end of the simulation
+        self._env.propagation = PropagationMetrics(self._env.report)
         # Set the monitor
         end_simulation = self._initial_time + self._sim_duration
         self._env.data = {
@@ -34,9 +56,15 @@ class SimulationWorld:
                 self._initial_time).strftime('%m-%d %H:%M:%S'),
             'end_simulation_time': datetime.utcfromtimestamp(end_simulation).strftime('%m-%d %H:%M:%S'),
             'created_transactions': 0,
-            'tx_propagation': {},
-            'block_propagation': {},
             'international_transactions': 0,
+            'known_inventory': {
+                'mode': self._config.get('known_inventory', {}).get('mode', 'exact'),
+                'track_false_positives': self._config.get('known_inventory', {}).get('track_false_positives', False),
+                'memory_bytes': 0,
+                'exact_memory_bytes': 0,
+                'memory_saved_bytes': 0,
+                'spurious_suppressions': 0
+            },
             # Jiali: add day to record the day from which the tx are imported.
             'day': 'DAY ' + str(day) + ' '
         }
@@ -49,13 +77,44 @@ class SimulationWorld:
     def locations(self):
         return self._locations
 
+    @property
+    def seed(self):
+        return self._seed
+
     @property
     def env(self):
         return self._env
 
+    @property
+    def start(self):
+        return self._initial_time
+
+    @property
+    def end(self):
+        return self._initial_time + self._sim_duration
+
+    def run(self, until=None):
+        """Runs the simulation until the simulated time `until` (the end by default).
+        It can be called again to continue, e.g. after writing a checkpoint"""
+        until = self.end if until is None else min(until, self.end)
+        if until > self._env.now:
+            self._env.run(until=until)
+
     def start_simulation(self):
-        end = self._initial_time + self._sim_duration
-        self._env.run(until=end)
+        profile = self._config.get('profile', False)
+        if profile:
+            # Wall-clock time per process, message id and handler
+            params = profile if isinstance(profile, dict) else {}
+            profiler = SimulationProfiler(
+                self._env, self.blockchain, params.get('sample_every', 1024), params.get('window', 64))
+            with profiler:
+                self.run()
+            self._env.data['profile'] = profiler.summary()
+            print(profiler.table())
+        else:
+            self.run()
+        self._env.data['tx_propagation'] = self._env.propagation.summary('tx')
+        self._env.data['block_propagation'] = self._env.propagation.summary('block')
 
     def _set_configs(self):
         """Injects the different configuration variables to the environment variable to be
@@ -105,6 +164,8 @@ class SimulationWorld:
         """Reads the file with the latencies measurements taken"""
         data = self._read_json_file(self._measured_latency)
         self._locations = list(data['locations'])
+        self._env.location_ids = {
+            location: location_id for location_id, location in enumerate(self._locations)}
         self._env.delays.update(dict(LATENCIES=data['locations']))
 
     def _set_throughputs(self):
@@ -125,6 +186,17 @@ class SimulationWorld:
             THROUGHPUT_SENT=throughput_sent['locations']
         ))
 
+    def _compile_delays(self):
+        """Compiles the latency and throughput measurements into matrices of samplers indexed
+        by location ID (see `Node.location_id`), so that a delay between two nodes is an
+        array index plus a buffered draw"""
+        self._env.delay_samplers = {
+            key: [[get_sampler(self._env.delays[key][origin][destination])
+                   for destination in self.locations]
+                  for origin in self.locations]
+            for key in ('LATENCIES', 'THROUGHPUT_RECEIVED', 'THROUGHPUT_SENT')
+        }
+
     def _validate_distribution(self, *distributions: dict):
         for distribution in distributions:
             distribution_schema = Schema({